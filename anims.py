@@ -2,6 +2,10 @@
 # check out https://easings.net for more animation functions
 
 import math
+try:
+    import numpy
+except:
+    numpy = None
 
 ease_out_expo = lambda t: 1 if t == 1 else 1 - math.pow(2, -10*t)
 ease_out_quad = lambda t: 1 - (1-t)*(1-t)
@@ -61,3 +65,61 @@ def ease_in_out_back(t):
 
 def linear(t): 
     return t
+
+EASINGS = {
+    "ease_out_expo": ease_out_expo,
+    "ease_out_quad": ease_out_quad,
+    "ease_out_bounce": ease_out_bounce,
+    "ease_in_out_bounce": ease_in_out_bounce,
+    "ease_out_elastic": ease_out_elastic,
+    "ease_in_out_elastic": ease_in_out_elastic,
+    "ease_out_back": ease_out_back,
+    "ease_in_out_back": ease_in_out_back,
+    "linear": linear,
+}
+
+# table samples per animation frame
+OVERSAMPLE = 8
+
+class Lut: 
+    # an easing sampled once into a table, then linearly interpolated
+    def __init__(self, f, frames: int) -> None:
+        self.n = max(frames, 1) * OVERSAMPLE
+        self.table = [f(i / self.n) for i in range(self.n + 1)]
+        # so table[i+1] exists at t == 1
+        self.table.append(self.table[-1])
+        if numpy:
+            self.xs = numpy.arange(len(self.table)) / self.n
+            self.ys = numpy.array(self.table)
+
+    def __call__(self, t: float) -> float:
+        if t <= 0:
+            return self.table[0]
+        if t >= 1:
+            return self.table[-1]
+        p = t * self.n
+        i = int(p)
+        a = self.table[i]
+        return a + (self.table[i+1] - a) * (p - i)
+
+    def many(self, ts):
+        # numpy arrays are interpolated in one call
+        if numpy and isinstance(ts, numpy.ndarray):
+            return numpy.interp(ts, self.xs, self.ys)
+        table = self.table
+        n = self.n
+        out = []
+        for t in ts:
+            if t <= 0:
+                out.append(table[0])
+            elif t >= 1:
+                out.append(table[-1])
+            else:
+                p = t * n
+                i = int(p)
+                a = table[i]
+                out.append(a + (table[i+1] - a) * (p - i))
+        return out
+
+def lut(name: str, frames: int) -> Lut:
+    return Lut(EASINGS[name], frames)
@@ -0,0 +1,197 @@
+#! /usr/bin/env python3
+# end to end animation benchmark, runs niri.py against mocksway.py
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from mocksway import MockSway
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# geometry messages closer than this belong to the same frame
+FRAME_GAP = 0.004
+# frame intervals longer than this are idle time, not jitter
+IDLE_GAP = 0.1
+# what --compare fails on, each is worse when higher, by more than --tolerance plus this much
+GATES = {
+    "messages_per_sec": 5,
+    "commands_per_sec": 20,
+    "frame_jitter_ms": 3,
+    "frame_interval_p95_ms": 4,
+    "latency_p50_ms": 2,
+    "latency_p95_ms": 4,
+}
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+def frames(log: list[tuple[float, str]]) -> list[float]:
+    out: list[float] = []
+    for t, cmd in log:
+        if "move absolute position" not in cmd and "resize set" not in cmd:
+            continue
+        if not out or t - out[-1] > FRAME_GAP:
+            out.append(t)
+    return out
+
+def report(name: str, mock: MockSway, t0: float, t1: float, actions: list[float]) -> dict:
+    log = [(t, c) for t, c in mock.log if t0 <= t <= t1]
+    frame_log = [(t, c) for t, c in log if "move absolute position" in c or "resize set" in c]
+    ftimes = frames(log)
+    intervals = [b - a for a, b in zip(ftimes, ftimes[1:]) if b - a < IDLE_GAP]
+
+    latency = []
+    for i, s in enumerate(actions):
+        end = actions[i+1] if i + 1 < len(actions) else t1
+        first = next((f for f in ftimes if s <= f < end), None)
+        if first is not None:
+            latency.append(first - s)
+
+    elapsed = t1 - t0
+    return {
+        "scenario": name,
+        "seconds": round(elapsed, 3),
+        "actions": len(actions),
+        "messages_per_sec": round(len(log) / elapsed, 1),
+        "window_updates_per_sec": round(sum(c.count("con_id=") for _, c in frame_log) / elapsed, 1),
+        "commands_per_sec": round(sum(c.count("move absolute position") + c.count("resize set") for _, c in frame_log) / elapsed, 1),
+        "frames": len(ftimes),
+        "frame_interval_ms": round(1000 * statistics.fmean(intervals), 2) if intervals else 0,
+        "frame_jitter_ms": round(1000 * statistics.pstdev(intervals), 2) if intervals else 0,
+        "frame_interval_p95_ms": round(1000 * percentile(intervals, 0.95), 2),
+        "latency_p50_ms": round(1000 * percentile(latency, 0.5), 2),
+        "latency_p95_ms": round(1000 * percentile(latency, 0.95), 2),
+        "latency_max_ms": round(1000 * max(latency), 2) if latency else 0,
+    }
+
+async def settle(mock: MockSway, quiet: float = 0.2, timeout: float = 10) -> None:
+    # wait until niri has stopped sending commands
+    end = time.perf_counter() + timeout
+    while time.perf_counter() < end:
+        seen = len(mock.log)
+        await asyncio.sleep(quiet)
+        if len(mock.log) == seen:
+            return
+
+async def hold(mock: MockSway, key: str, seconds: float, rate: float) -> list[float]:
+    # key repeat
+    actions = []
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        actions.append(time.perf_counter())
+        mock.key(key)
+        await asyncio.sleep(1 / rate)
+    return actions
+
+async def run(args) -> list[dict]:
+    tmp = tempfile.mkdtemp()
+    path = os.path.join(tmp, "sway.sock")
+    mock = await MockSway(path, refresh = int(args.refresh * 1000), latency = args.latency).start()
+    # its own control socket, snapshot and (no) config, a running niri.py's are left alone
+    env = dict(os.environ, SWAYSOCK = path, XDG_RUNTIME_DIR = tmp, XDG_CONFIG_HOME = tmp)
+    env.pop("I3SOCK", None)
+    proc = await asyncio.create_subprocess_exec(sys.executable, os.path.join(HERE, "niri.py"), env = env)
+
+    results = []
+    try:
+        # ready once it listens for windows and has bound its keys
+        while not any("window" in s for s in mock.subs.values()) or "Mod4+l" not in mock.binds:
+            if proc.returncode is not None:
+                raise RuntimeError("niri.py exited during setup")
+            await asyncio.sleep(0.05)
+        await settle(mock)
+
+        t0 = time.perf_counter()
+        actions = []
+        for _ in range(args.windows):
+            actions.append(time.perf_counter())
+            mock.open_window()
+            await asyncio.sleep(args.open_gap)
+        await settle(mock)
+        results.append(report(f"open {args.windows} windows", mock, t0, time.perf_counter(), actions))
+
+        for key, name in (("Mod4+h", "hold left"), ("Mod4+l", "hold right")):
+            t0 = time.perf_counter()
+            actions = await hold(mock, key, args.hold, args.repeat)
+            await settle(mock)
+            results.append(report(f"{name} {args.hold}s", mock, t0, time.perf_counter(), actions))
+
+        t0 = time.perf_counter()
+        actions = []
+        for i in range(args.switches):
+            actions.append(time.perf_counter())
+            mock.key("Mod4+j" if i % 2 == 0 else "Mod4+k")
+            await asyncio.sleep(args.switch_gap)
+        await settle(mock)
+        results.append(report(f"switch workspace x{args.switches}", mock, t0, time.perf_counter(), actions))
+    finally:
+        if proc.returncode is None:
+            proc.terminate()
+            await proc.wait()
+        await mock.stop()
+    return results
+
+def compare(old: list[dict], new: list[dict], tolerance: float) -> list[str]:
+    # prints the gated results next to old's, returns the ones that got worse
+    worse = []
+    before = {r["scenario"]: r for r in old}
+    print(f"{'':<26}{'old':>10}{'new':>10}{'ratio':>8}")
+    for r in new:
+        o = before.get(r["scenario"])
+        if o is None:
+            continue
+        print(r["scenario"])
+        for k, slack in GATES.items():
+            # a p95 of under 20 actions is just the slowest one
+            if k == "latency_p95_ms" and r["actions"] < 20:
+                continue
+            a, b = o[k], r[k]
+            bad = b > a * (1 + tolerance) + slack
+            if bad:
+                worse.append(f"{r['scenario']}: {k} {a} -> {b}")
+            print(f"  {k:<24}{a:>10}{b:>10}{b / a if a else 0:>8.2f}{'  worse' if bad else ''}")
+    return worse
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description = "SniriFX animation benchmark against mocksway.py")
+    parser.add_argument("--windows", type = int, default = 50)
+    parser.add_argument("--open-gap", type = float, default = 0.05, help = "seconds between new windows")
+    parser.add_argument("--hold", type = float, default = 2, help = "seconds each direction key is held")
+    parser.add_argument("--repeat", type = float, default = 25, help = "key repeat rate in Hz")
+    parser.add_argument("--switches", type = int, default = 10)
+    parser.add_argument("--switch-gap", type = float, default = 0.5)
+    parser.add_argument("--refresh", type = float, default = 60, help = "refresh rate the mock output reports")
+    parser.add_argument("--latency", type = float, default = 0, help = "seconds the mock takes to reply to each command")
+    parser.add_argument("--json", help = "also write the results to this file")
+    parser.add_argument("--compare", help = "results of an earlier --json run to compare against, exits 1 on a regression")
+    parser.add_argument("--tolerance", type = float, default = 0.25, help = "fraction worse than the --compare run that still passes")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+
+    keys = list(results[0].keys())[1:]
+    for r in results:
+        print(r["scenario"])
+        for k in keys:
+            print(f"  {k:<24}{r[k]}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent = 2)
+    if args.compare:
+        with open(args.compare) as f:
+            worse = compare(json.load(f), results, args.tolerance)
+        if worse:
+            print(f"regressed past {args.tolerance:.0%}:")
+            for w in worse:
+                print(f"  {w}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+#! /usr/bin/env python3
+# layout microbenchmarks, times niri.py's layout structures on synthetic layouts without sway
+import argparse
+import json
+import math
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+from i3ipc import Rect
+
+import niri
+
+SIZES = [10, 50, 100, 500, 1000, 5000]
+# --compare allows this much on top of --tolerance before an op counts as slower
+SLACK_US = 0.5
+# and this much growth in an op's scaling exponent, 1 more is a whole extra factor of the window count
+SCALING = 0.3
+# memory doesn't vary between runs, so any real growth counts
+MEMORY = 0.05
+
+def step(coro):
+    # the layout coroutines never wait on anything, so one send runs them to the end
+    try:
+        coro.send(None)
+    except StopIteration as e:
+        return e.value
+    raise RuntimeError("layout coroutine suspended")
+
+def build(windows: int, depth: int, columns: int) -> tuple[niri.Niri, niri.Output]:
+    # windows stacked depth to a column, columns to a workspace, as many workspaces as that takes
+    n = niri.Niri()
+    output = niri.Output(None, None, "BENCH-1", Rect(dict(x = 0, y = 0, width = 1920, height = 1080)), 60, lambda: None) # type: ignore
+    n.outputs[output.name] = output
+    n.focused = output
+    ws = output.stack
+    cont = None
+    for id in range(windows):
+        if cont is None or cont.size == depth:
+            if ws.size == columns:
+                new = niri.Workspace()
+                output.add(new, ws)
+                ws = new
+            cont = niri.Container(output.screen.width // 2)
+            ws.add(cont, ws.focus)
+            ws.focus = cont
+        win = niri.Window(dict(x = 0, y = 0, width = 100, height = 100), id)
+        cont.add(win)
+        n.windows[id] = win
+    for ws in output:
+        if ws.focus:
+            step(ws.focus_cont(ws.focus))
+    return n, output
+
+def timeit(fn, repeat: int) -> float:
+    # best of repeat, in seconds
+    best = math.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def bench(windows: int, args) -> list[dict]:
+    rng = random.Random(windows)
+    results = []
+
+    def add(op: str, seconds: float, calls: int = 1) -> None:
+        # ops timed once go over the whole layout, per window is what they cost as it grows
+        results.append({
+            "op": op,
+            "windows": windows,
+            "calls": calls,
+            "us_per_call": round(1e6 * seconds / calls, 3),
+            "ns_per_window": round(1e9 * seconds / windows, 2) if calls == 1 else None,
+        })
+
+    add("build", timeit(lambda: build(windows, args.depth, args.columns), args.repeat))
+
+    n, output = build(windows, args.depth, args.columns)
+    ws = output.current
+    cols = ws.columns()
+    conts = [c for w in output for c in w]
+    ids = list(n.windows)
+    rng.shuffle(ids)
+
+    def organise() -> None:
+        for w in output:
+            w.reflow()
+            step(w.anchor_set(w.anchor, w.anchordir))
+    add("organise", timeit(organise, args.repeat))
+
+    picks = [rng.choice(cols) for _ in range(args.calls)]
+    def focus_cont() -> None:
+        for c in picks:
+            step(ws.focus_cont(c))
+    add("focus_cont", timeit(focus_cont, args.repeat), len(picks))
+
+    def anchor_set() -> None:
+        for c in picks:
+            step(ws.anchor_set(c, 0.5))
+    add("anchor_set", timeit(anchor_set, args.repeat), len(picks))
+
+    def resize() -> None:
+        # a width change only restales the offsets from that column on
+        for c in picks:
+            c.width += 10
+            ws.columns()
+            c.width -= 10
+            ws.columns()
+    add("resize_column", timeit(resize, args.repeat), 2 * len(picks))
+
+    pairs = [c for c in picks if c.next]
+    def swap() -> None:
+        for c in pairs:
+            ws.swap(c, c.next) # type: ignore
+            ws.swap(c.prev, c) # type: ignore
+        ws.columns()
+    if pairs:
+        add("swap", timeit(swap, args.repeat), 2 * len(pairs))
+
+    def add_remove() -> None:
+        for c in picks:
+            root = c.prev
+            ws.remove(c)
+            ws.add(c, root)
+            ws.columns()
+    add("remove_add_column", timeit(add_remove, args.repeat), len(picks))
+
+    def lookup() -> None:
+        for id in ids:
+            n.workspace_with_win(id)
+    add("workspace_with_win", timeit(lookup, args.repeat), len(ids))
+
+    def iterate() -> None:
+        for c in conts:
+            for win in c:
+                pass
+    add("iterate", timeit(iterate, args.repeat))
+
+    def retarget() -> None:
+        output.animator.cancel()
+        output.current = output.current.next or output.stack
+        output.retarget()
+    add("retarget", timeit(retarget, args.repeat))
+    return results
+
+def memory(windows: int, args) -> float:
+    # bytes allocated per window for the whole layout, animator included
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    layout = build(windows, args.depth, args.columns)
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del layout
+    return round(size / windows, 1)
+
+def scaling(results: list[dict]) -> dict[str, float]:
+    # slope of log(time) against log(windows), 0 is flat and 1 grows linearly with the layout
+    out = {}
+    for op in dict.fromkeys(r["op"] for r in results):
+        rs = [r for r in results if r["op"] == op]
+        if len(rs) < 2:
+            continue
+        xs = [math.log(r["windows"]) for r in rs]
+        ys = [math.log(max(r["us_per_call"], 1e-3)) for r in rs]
+        mx, my = statistics.fmean(xs), statistics.fmean(ys)
+        out[op] = round(sum((x-mx)*(y-my) for x, y in zip(xs, ys)) / sum((x-mx)**2 for x in xs), 3)
+    return out
+
+def compare(old: dict, new: dict, tolerance: float) -> list[str]:
+    # prints the ratios, returns what got more than tolerance slower, or bigger or worse scaling
+    worse = []
+    before = {(r["op"], r["windows"]): r["us_per_call"] for r in old["results"]}
+    print(f"{'op':<20}{'windows':>8}{'old us':>12}{'new us':>12}{'ratio':>8}")
+    for r in new["results"]:
+        o = before.get((r["op"], r["windows"]))
+        if o is None:
+            continue
+        # sub-microsecond ops are mostly timer noise, they get that much slack
+        if r["us_per_call"] > o * (1 + tolerance) + SLACK_US:
+            worse.append(f"{r['op']} at {r['windows']} windows {o:.3f}us -> {r['us_per_call']:.3f}us")
+        print(f"{r['op']:<20}{r['windows']:>8}{o:>12.3f}{r['us_per_call']:>12.3f}{r['us_per_call'] / o if o else 0:>8.2f}")
+    for k, v in new["memory"].items():
+        o = old["memory"].get(k)
+        if o:
+            if v > o * (1 + MEMORY):
+                worse.append(f"bytes/window at {k} windows {o:.1f} -> {v:.1f}")
+            print(f"{'bytes/window':<20}{k:>8}{o:>12.1f}{v:>12.1f}{v / o:>8.2f}")
+    for op, k in new["scaling"].items():
+        o = old["scaling"].get(op)
+        if o is None:
+            continue
+        if k > o + SCALING:
+            worse.append(f"{op} scaling exponent {o} -> {k}")
+        print(f"{op:<20}{'slope':>8}{o:>12.3f}{k:>12.3f}")
+    return worse
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description = "SniriFX layout microbenchmarks, no sway needed")
+    parser.add_argument("--sizes", type = int, nargs = "+", default = SIZES, help = "window counts to build layouts of")
+    parser.add_argument("--depth", type = int, default = 3, help = "windows stacked in each column")
+    parser.add_argument("--columns", type = int, default = 300, help = "columns in each workspace, the offset cache matters most with hundreds")
+    parser.add_argument("--calls", type = int, default = 200, help = "calls timed per op where an op is a single call")
+    parser.add_argument("--repeat", type = int, default = 5, help = "best of this many runs")
+    parser.add_argument("--json", help = "also write the results to this file")
+    parser.add_argument("--compare", help = "results of an earlier --json run to compare against, exits 1 on a regression")
+    parser.add_argument("--tolerance", type = float, default = 1.0, help = "fraction slower than the --compare run that still passes, runs of the same code can differ by most of 2x on a busy machine")
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        results += bench(size, args)
+    out = {
+        "python": platform.python_version(),
+        "numpy": niri.numpy is not None,
+        "depth": args.depth,
+        "columns": args.columns,
+        "results": results,
+        "scaling": scaling(results),
+        "memory": {str(size): memory(size, args) for size in args.sizes},
+    }
+
+    print(f"{'op':<20}{'windows':>8}{'us/call':>12}{'ns/window':>12}")
+    for r in results:
+        per = "" if r["ns_per_window"] is None else f"{r['ns_per_window']:.2f}"
+        print(f"{r['op']:<20}{r['windows']:>8}{r['us_per_call']:>12.3f}{per:>12}")
+    print("scaling exponent")
+    for op, k in out["scaling"].items():
+        print(f"  {op:<20}{k}")
+    print("bytes per window")
+    for size, b in out["memory"].items():
+        print(f"  {size:<20}{b}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(out, f, indent = 2)
+    if args.compare:
+        with open(args.compare) as f:
+            worse = compare(json.load(f), out, args.tolerance)
+        if worse:
+            print(f"regressed past {args.tolerance:.0%}:")
+            for w in worse:
+                print(f"  {w}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+#! /usr/bin/env python3
+# checks Workspace.focus_cont and anchor_set against the list walking versions the offset cache
+# replaced, by running the same random edits on both and comparing every window after each one
+import argparse
+import random
+import sys
+
+from i3ipc import Rect
+
+import niri
+from bench_layout import step
+
+class RefContainer(niri.Container):
+    async def organise(self, x: float) -> None:
+        # the old organise placed its windows every time
+        self.x = x
+        screen = self.parent.screen # type: ignore
+        height = screen.height // self.size
+        p = screen.y + screen.height
+        cur = self.stack
+        while cur:
+            p -= height
+            await cur.set(x = x, y = p, width = self.width, height = height)
+            cur = cur.next
+
+class RefWorkspace(niri.Workspace):
+    async def focus_cont(self, cont: niri.Container) -> None:
+        if not self.anchor:
+            self.anchor = cont
+            self.anchordir = 0
+            self.focus = cont
+        screen = self.screen
+
+        if self.anchordir == 1:
+            width = 0
+            cur = self.anchor
+            while cur:
+                width += cur.width
+                cur = cur.prev
+            if width <= screen.width:
+                if self.stack:
+                    await self.anchor_set(self.stack, 0)
+
+        P = self.anchordir * screen.width + screen.x
+        for d in [-1, 1]:
+            p = P
+            if self.anchordir == 0.5:
+                p += -1*d*self.anchor.width//2
+            cur = self.anchor
+            while cur:
+                p += cur.width * d
+                if cur == cont:
+                    if p > screen.x + screen.width or p < screen.x:
+                        await self.anchor_set(cur, (d + 1) // 2)
+                        return
+                    break
+                cur = cur.next if d > 0 else cur.prev
+        await self.anchor_set(self.anchor, self.anchordir)
+
+    async def anchor_set(self, cont: niri.Container, adir: float) -> None:
+        self.anchordir = adir
+        self.anchor = cont
+        if not self.anchor:
+            return
+        screen = self.screen
+        P = (screen.width * adir + screen.x) - (adir*cont.width)
+        for d in [1, -1]:
+            p = P
+            cur = self.anchor
+            while cur:
+                if d == -1 and cur == self.anchor:
+                    cur = cur.prev
+                    continue
+                if d == -1:
+                    p -= cur.width
+                    await cur.organise(p)
+                else:
+                    await cur.organise(p)
+                    p += cur.width
+                cur = cur.next if d > 0 else cur.prev
+
+class Layout:
+    # one workspace edited the way Niri's handlers edit it
+    def __init__(self, ws_class, cont_class) -> None:
+        self.cont_class = cont_class
+        self.output = niri.Output(None, None, "CHECK-1", Rect(dict(x = 0, y = 0, width = 1920, height = 1080)), 60, lambda: None) # type: ignore
+        self.ws = ws_class()
+        self.output.add(self.ws)
+        self.next_id = 0
+
+    def cols(self) -> list[niri.Container]:
+        return list(self.ws)
+
+    def window(self) -> niri.Window:
+        self.next_id += 1
+        return niri.Window(dict(x = 0, y = 0, width = 100, height = 100), self.next_id)
+
+    def add(self) -> None:
+        cont = self.cont_class(self.output.screen.width // 2)
+        cont.add(self.window())
+        self.ws.add(cont, self.ws.focus)
+        self.ws.focus = cont
+        step(self.ws.focus_cont(cont))
+
+    def stack(self, i: int) -> None:
+        cont = self.cols()[i]
+        cont.add(self.window())
+        self.ws.focus = cont
+        step(self.ws.focus_cont(cont))
+
+    def remove(self, i: int) -> None:
+        ws = self.ws
+        cont = self.cols()[i]
+        new_focus = cont.prev or cont.next
+        if ws.anchor == cont:
+            ws.anchor = new_focus
+        ws.remove(cont)
+        ws.focus = new_focus
+        if new_focus:
+            step(ws.focus_cont(new_focus))
+
+    def resize(self, i: int, dw: int) -> None:
+        cont = self.cols()[i]
+        cont.width = max(150, min(cont.width + dw, self.output.screen.width))
+        self.ws.focus = cont
+        step(self.ws.focus_cont(cont))
+
+    def swap(self, i: int) -> None:
+        ws = self.ws
+        cont = self.cols()[i]
+        if not cont.prev:
+            return
+        if ws.anchor == cont:
+            ws.anchor = cont.prev
+        ws.swap(cont.prev, cont)
+        ws.focus = cont
+        step(ws.focus_cont(cont))
+
+    def center(self, i: int) -> None:
+        step(self.ws.anchor_set(self.cols()[i], 0.5))
+
+    def focus(self, i: int) -> None:
+        cont = self.cols()[i]
+        self.ws.focus = cont
+        step(self.ws.focus_cont(cont))
+
+    def state(self) -> tuple:
+        cols = self.cols()
+        wins = [(w.x, w.y, w.width, w.height) for c in cols for w in c]
+        anchor = cols.index(self.ws.anchor) if self.ws.anchor in cols else None
+        return wins, anchor, self.ws.anchordir
+
+def run(seed: int, ops: int, columns: int) -> str | None:
+    # the first op that leaves the two layouts different, None if none did
+    rng = random.Random(seed)
+    new = Layout(niri.Workspace, niri.Container)
+    ref = Layout(RefWorkspace, RefContainer)
+    for n in range(ops):
+        size = new.ws.size
+        op = rng.choice(["add"] * (3 if size < columns else 0) + ["stack", "remove", "resize", "swap", "center", "focus"]) if size else "add"
+        args = []
+        if op != "add":
+            args.append(rng.randrange(size))
+        if op == "resize":
+            args.append(rng.choice([-niri.DWIDTH, niri.DWIDTH, niri.DWIDTH * rng.randint(2, 10)]))
+        for layout in (new, ref):
+            getattr(layout, op)(*args)
+        if new.state() != ref.state():
+            return f"seed {seed} op {n} {op}{tuple(args)} with {size} columns"
+    return None
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description = "compare the cached column layout against the original list walk")
+    parser.add_argument("--seeds", type = int, default = 20, help = "random edit sequences to run")
+    parser.add_argument("--ops", type = int, default = 1200, help = "edits per sequence")
+    parser.add_argument("--columns", type = int, default = 300, help = "most columns a workspace grows to")
+    args = parser.parse_args()
+
+    for seed in range(args.seeds):
+        failed = run(seed, args.ops, args.columns)
+        if failed:
+            print(f"layouts differ: {failed}")
+            sys.exit(1)
+    print(f"{args.seeds} sequences of {args.ops} edits, layouts identical")
+
+if __name__ == "__main__":
+    main()
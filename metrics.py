@@ -0,0 +1,92 @@
+# frame timing and ipc latency instrumentation, only created when niri.METRICS is set
+
+import bisect
+import time
+from collections import deque
+
+# frame duration histogram bucket bounds in ms
+FRAME_BUCKETS = [1, 2, 4, 8, 12, 16, 24, 33, 50, 100]
+# samples kept for percentiles
+SAMPLES = 2048
+# actions without a frame after this many seconds did not animate
+ACTION_TIMEOUT = 1
+
+def percentiles(samples) -> dict:
+    if not samples:
+        return {"count": 0}
+    s = sorted(samples)
+    at = lambda p: round(1000 * s[min(int(len(s) * p), len(s) - 1)], 3)
+    return {"count": len(s), "p50": at(0.5), "p90": at(0.9), "p99": at(0.99), "max": round(1000 * s[-1], 3)}
+
+class Histogram:
+    def __init__(self, bounds: list[float]) -> None:
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total: float = 0
+
+    def add(self, v: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, v)] += 1
+        self.count += 1
+        self.total += v
+
+    def dump(self) -> dict:
+        buckets = {f"<={b}": n for b, n in zip(self.bounds, self.counts)}
+        buckets[f">{self.bounds[-1]}"] = self.counts[-1]
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count, 3) if self.count else 0,
+            "buckets": buckets,
+        }
+
+class Metrics:
+    def __init__(self) -> None:
+        self.started = time.time()
+        self.frame_ms = Histogram(FRAME_BUCKETS)
+        self.late = 0
+        self.dropped = 0
+        self.fps: float = 0
+        self.ipc: deque[float] = deque(maxlen=SAMPLES)
+        # frame commands sway replied to with an error
+        self.failed = 0
+        # resize or move commands left out because the window was already there
+        self.skipped = 0
+        # window updates put off to a later frame by the BUDGET
+        self.deferred = 0
+        self.actions: dict[str, deque[float]] = {}
+        # actions waiting on their first frame
+        self.pending: list[tuple[str, float]] = []
+
+    def frame(self, cost: float, late: float, budget: float) -> None:
+        self.frame_ms.add(cost * 1000)
+        if late > budget / 4:
+            self.late += 1
+
+    def command(self, seconds: float) -> None:
+        self.ipc.append(seconds)
+
+    def action(self, name: str) -> None:
+        self.pending.append((name, time.perf_counter()))
+
+    def first_frame(self) -> None:
+        now = time.perf_counter()
+        for name, t in self.pending:
+            if now - t < ACTION_TIMEOUT:
+                self.actions.setdefault(name, deque(maxlen=SAMPLES)).append(now - t)
+        self.pending.clear()
+
+    def dump(self) -> dict:
+        return {
+            "uptime": round(time.time() - self.started, 1),
+            "frames": {
+                "fps": round(self.fps, 2),
+                "late": self.late,
+                "dropped": self.dropped,
+                "duration_ms": self.frame_ms.dump(),
+            },
+            "ipc_ms": percentiles(self.ipc),
+            "ipc_failed": self.failed,
+            "commands_skipped": self.skipped,
+            "updates_deferred": self.deferred,
+            "action_to_frame_ms": {name: percentiles(s) for name, s in self.actions.items()},
+        }
@@ -0,0 +1,294 @@
+#! /usr/bin/env python3
+# a headless stand in for sway's ipc socket, enough of it for niri.py to run against
+import asyncio
+import json
+import os
+import re
+import struct
+import sys
+import time
+
+MAGIC = b"i3-ipc"
+HEADER = f"={len(MAGIC)}sII"
+HEADER_SIZE = struct.calcsize(HEADER)
+
+RUN_COMMAND = 0
+GET_WORKSPACES = 1
+SUBSCRIBE = 2
+GET_OUTPUTS = 3
+GET_TREE = 4
+GET_MARKS = 5
+GET_VERSION = 7
+GET_BINDING_MODES = 8
+SEND_TICK = 10
+
+# event types have the highest bit set
+EVENTS = {
+    "workspace": 0,
+    "output": 1,
+    "mode": 2,
+    "window": 3,
+    "barconfig_update": 4,
+    "binding": 5,
+    "shutdown": 6,
+    "tick": 7,
+}
+
+CRITERIA = re.compile(r'\[con_id="?(\d+)"?\]\s*')
+
+def pack(kind: int, payload) -> bytes:
+    data = json.dumps(payload).encode()
+    return MAGIC + struct.pack("=II", len(data), kind) + data
+
+def split(cmd: str, sep: str) -> list[str]:
+    # split on sep outside of quotes
+    out = []
+    quote = None
+    cur = ""
+    for c in cmd:
+        if quote:
+            if c == quote:
+                quote = None
+        elif c in "'\"":
+            quote = c
+        elif c == sep:
+            out.append(cur)
+            cur = ""
+            continue
+        cur += c
+    out.append(cur)
+    return [o.strip() for o in out if o.strip()]
+
+class MockWindow:
+    def __init__(self, id: int, rect: dict) -> None:
+        self.id = id
+        self.rect = rect
+        self.marks: list[str] = []
+        self.floating = False
+
+    def ipc(self, focused: bool) -> dict:
+        return {
+            "id": self.id,
+            "type": "floating_con" if self.floating else "con",
+            "name": f"mock {self.id}",
+            "app_id": "mock",
+            "pid": 0,
+            "focused": focused,
+            "marks": self.marks,
+            "rect": dict(self.rect),
+            "window_rect": dict(x = 0, y = 0, width = self.rect["width"], height = self.rect["height"]),
+            "deco_rect": dict(x = 0, y = 0, width = 0, height = 0),
+            "nodes": [],
+            "floating_nodes": [],
+        }
+
+class MockSway:
+    def __init__(self, path: str, width: int = 1920, height: int = 1080, refresh: int = 60000, latency: float = 0) -> None:
+        self.path = path
+        # seconds each RUN_COMMAND takes to reply, to play a slow compositor
+        self.latency = latency
+        self.output = dict(x = 0, y = 0, width = width, height = height)
+        self.refresh = refresh
+        self.windows: dict[int, MockWindow] = {}
+        self.focused: int | None = None
+        self.binds: dict[str, str] = {}
+        # modes the config would define, and the one switched to last
+        self.modes = ["default"]
+        self.mode = "default"
+        self.next_id = 100
+        # (time, payload) of every RUN_COMMAND received
+        self.log: list[tuple[float, str]] = []
+        # (time, event, change) of every event sent
+        self.events: list[tuple[float, str, str]] = []
+        self.subs: dict[asyncio.StreamWriter, set[str]] = {}
+        self.server: asyncio.AbstractServer | None = None
+
+    async def start(self) -> "MockSway":
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.server = await asyncio.start_unix_server(self.client, self.path)
+        return self
+
+    async def stop(self) -> None:
+        if self.server:
+            self.server.close()
+            for w in list(self.subs):
+                w.close()
+            await self.server.wait_closed()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    async def client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                header = await reader.readexactly(HEADER_SIZE)
+                magic, length, kind = struct.unpack(HEADER, header)
+                if magic != MAGIC:
+                    break
+                payload = (await reader.readexactly(length)).decode()
+                reply = self.handle(writer, kind, payload)
+                if kind == RUN_COMMAND and self.latency:
+                    await asyncio.sleep(self.latency)
+                writer.write(pack(kind, reply))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.subs.pop(writer, None)
+            writer.close()
+
+    def handle(self, writer: asyncio.StreamWriter, kind: int, payload: str):
+        if kind == RUN_COMMAND:
+            self.log.append((time.perf_counter(), payload))
+            return self.run(payload)
+        if kind == SUBSCRIBE:
+            self.subs.setdefault(writer, set()).update(json.loads(payload))
+            return {"success": True}
+        if kind == GET_TREE:
+            return self.tree()
+        if kind == GET_OUTPUTS:
+            return [self.output_ipc()]
+        if kind == GET_WORKSPACES:
+            return [{
+                "num": 1, "name": "1", "visible": True, "focused": True, "urgent": False,
+                "rect": dict(self.output), "output": "MOCK-1"
+            }]
+        if kind == GET_MARKS:
+            return [m for w in self.windows.values() for m in w.marks]
+        if kind == GET_VERSION:
+            return {"major": 1, "minor": 10, "patch": 0, "human_readable": "mocksway", "loaded_config_file_name": ""}
+        if kind == GET_BINDING_MODES:
+            return self.modes
+        if kind == SEND_TICK:
+            return {"success": True}
+        return {"success": False, "error": "unsupported message"}
+
+    def output_ipc(self) -> dict:
+        mode = dict(width = self.output["width"], height = self.output["height"], refresh = self.refresh)
+        return {
+            "name": "MOCK-1", "active": True, "primary": True, "focused": True,
+            "current_workspace": "1", "rect": dict(self.output), "scale": 1.0,
+            "modes": [mode], "current_mode": mode,
+        }
+
+    def tree(self) -> dict:
+        windows = [w.ipc(w.id == self.focused) for w in self.windows.values()]
+        workspace = {
+            "id": 3, "type": "workspace", "name": "1", "num": 1, "rect": dict(self.output),
+            "nodes": [w for w in windows if w["type"] == "con"],
+            "floating_nodes": [w for w in windows if w["type"] == "floating_con"],
+        }
+        output = {"id": 2, "type": "output", "name": "MOCK-1", "rect": dict(self.output), "nodes": [workspace]}
+        return {"id": 1, "type": "root", "name": "root", "rect": dict(self.output), "nodes": [output]}
+
+    def emit(self, event: str, payload: dict) -> None:
+        self.events.append((time.perf_counter(), event, payload.get("change", "")))
+        data = pack(1 << 31 | EVENTS[event], payload)
+        for writer, events in self.subs.items():
+            if event in events:
+                writer.write(data)
+
+    def window_event(self, change: str, win: MockWindow) -> None:
+        self.emit("window", {"change": change, "container": win.ipc(win.id == self.focused)})
+
+    def run(self, payload: str) -> list[dict]:
+        replies = []
+        for part in split(payload, ";"):
+            target = None
+            m = CRITERIA.match(part)
+            if m:
+                target = int(m.group(1))
+                part = part[m.end():]
+            elif self.focused is not None:
+                target = self.focused
+            for cmd in split(part, ","):
+                replies.append(self.run_one(target, cmd))
+        return replies
+
+    def run_one(self, target: int | None, cmd: str) -> dict:
+        words = cmd.split()
+        if not words:
+            return {"success": True}
+        if words[0] == "bindsym":
+            args = [w for w in words[1:] if not w.startswith("--")]
+            key = args[0]
+            self.binds[key] = cmd.split(key, 1)[1].strip()
+            return {"success": True}
+        if words[0] in ("nop", "mouse_warping", "unbindsym"):
+            return {"success": True}
+        if words[0] == "mode":
+            mode = cmd.split(None, 1)[1].strip("'\"")
+            if mode not in self.modes:
+                return {"success": False, "error": f"unknown mode {mode}"}
+            self.mode = mode
+            return {"success": True}
+
+        win = self.windows.get(target) # type: ignore
+        if not win:
+            return {"success": False, "error": f"no window matches {target}"}
+
+        if words[:2] == ["resize", "set"]:
+            nums = [int(w.rstrip("px")) for w in words[2:] if w.rstrip("px").lstrip("-").isdigit()]
+            if win.floating:
+                # like sway's resize_set_floating, the growth is split around the centre
+                win.rect["x"] -= (nums[0] - win.rect["width"]) // 2
+                win.rect["y"] -= (nums[1] - win.rect["height"]) // 2
+            win.rect["width"], win.rect["height"] = nums[0], nums[1]
+        elif words[:3] == ["move", "absolute", "position"]:
+            win.rect["x"], win.rect["y"] = int(words[3].rstrip("px")), int(words[4].rstrip("px"))
+        elif words == ["floating", "enable"]:
+            win.floating = True
+        elif words == ["focus"]:
+            if self.focused != win.id:
+                self.focused = win.id
+                self.window_event("focus", win)
+        elif words[0] == "mark":
+            win.marks.append(words[-1].strip("'\""))
+            self.window_event("mark", win)
+        elif words[0] == "unmark":
+            win.marks = []
+            self.window_event("mark", win)
+        elif words[0] == "kill":
+            self.close(win.id)
+        return {"success": True}
+
+    def open_window(self) -> int:
+        id = self.next_id
+        self.next_id += 1
+        win = MockWindow(id, dict(x = 0, y = 0, width = 640, height = 480))
+        self.windows[id] = win
+        self.window_event("new", win)
+        self.focused = id
+        self.window_event("focus", win)
+        return id
+
+    def close(self, id: int) -> None:
+        win = self.windows.pop(id)
+        if self.focused == id:
+            self.focused = None
+        self.window_event("close", win)
+
+    def key(self, key: str) -> None:
+        # what sway does when a bound key is pressed
+        cmd = self.binds[key]
+        self.emit("binding", {"change": "run", "binding": {
+            "command": cmd, "event_state_mask": key.split("+")[:-1], "input_code": 0,
+            "symbol": key.split("+")[-1], "input_type": "keyboard",
+        }})
+        self.run(cmd)
+
+async def main(path: str) -> None:
+    mock = await MockSway(path).start()
+    print(f"SWAYSOCK={path}")
+    seen = 0
+    while True:
+        await asyncio.sleep(0.5)
+        for t, cmd in mock.log[seen:]:
+            print(f"{t:.4f} {cmd}")
+        seen = len(mock.log)
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else f"/tmp/mocksway.{os.getpid()}.sock"))
+    except KeyboardInterrupt:
+        pass
@@ -1,39 +1,302 @@
 #! /usr/bin/env python3
-from i3ipc import Con, Rect, Event, WindowEvent, WorkspaceEvent
+from i3ipc import Con, Rect, Event, WindowEvent, WorkspaceEvent, BindingEvent
 from i3ipc.aio import Connection
 from i3ipc.events import WindowEvent
+import os
+import sys
+import json
 import time
+import math
+import struct
+import signal
 import asyncio
+from array import array
+from collections import deque
+from metrics import Metrics
 
-TRUE_SCREEN_HEIGHT = 1080
-SCREEN = Rect(dict(
-    x = 5,
-    y = 55,
-    width = 1910,
-    height = 1020
-))
+# space kept clear at the edges of each output for bars and gaps, by output name, "*" for any other
+RESERVE = {
+    "*": dict(top = 55, right = 5, bottom = 5, left = 5),
+}
 
 DWIDTH = 100
-FPS = 60
+# None follows the output's refresh rate
+FPS: float | None = None
+# the frame rate is divided down to no lower than this when frames take too long
+MIN_FPS = 20
 DURATION = 0.3
+# how much of a window's speed carries into a retargeted animation, 0 to disable
+MOMENTUM = 1.0
+# only the workspaces being switched between animate, the rest are put in place once and left alone
+PARK = True
+# seconds between full get_tree checks of the geometry cache
+RECONCILE = 10
+# max windows sent per ipc message in a frame
+BATCH = 32
+# max windows updated per frame, the closest to the focused column go first and the rest catch up
+# over the next frames, 0 for no limit
+BUDGET = 48
+# connections each output's frame commands are spread over, events and input handling get their own
+COMMAND_SOCKETS = 2
+# frame messages a command connection may have unanswered before the next frame waits
+INFLIGHT = 4
+# record frame and ipc timings, queried through the CONTROL socket
+METRICS = False
+CONTROL = os.path.join(os.environ.get("XDG_RUNTIME_DIR", "/tmp"), "snirifx.sock")
+# the layout is saved here every SAVE seconds it changed, and rebuilt from it on start
+SNAPSHOT = os.path.join(os.environ.get("XDG_RUNTIME_DIR", "/tmp"), "snirifx.json")
+SAVE = 5
+# log every sway event and command to this file for replay.py, .gz to compress it
+RECORD: str | None = None
+# any name in anims.EASINGS
+EASING = "ease_out_quad"
+# sway mode the overview switches to, if the sway config defines one, for keys that only act inside it
+OVERVIEW_MODE = "snirifx"
+# key -> action, bound as `nop snirifx <action>`, see Niri.actions
+BINDINGS = {
+    "Mod4+k": "up",
+    "Mod4+j": "down",
+    "Mod4+h": "left",
+    "Mod4+l": "right",
+    "Mod4+equal": "incwidth",
+    "Mod4+minus": "decwidth",
+    "Mod4+Ctrl+h": "moveleft",
+    "Mod4+Ctrl+l": "moveright",
+    "Mod4+Shift+h": "swapleft",
+    "Mod4+Shift+l": "swapright",
+    "Mod4+Shift+j": "movedown",
+    "Mod4+Shift+k": "moveup",
+    "Mod4+c": "center",
+    "Mod4+Shift+c": "fullwidth",
+    "Mod4+o": "overview",
+}
+# any of the above by its lowercase name, reloaded when it changes or on SIGHUP
+CONFIG = os.path.join(os.environ.get("XDG_CONFIG_HOME", os.path.expanduser("~/.config")), "snirifx", "config.toml")
+try:
+    import tomllib
+except:
+    tomllib = None
 try: 
     import anims
-    DX = anims.ease_out_quad
 except:
-    DX = lambda t: 1 - (1-t)*(1-t)
+    anims = None
+# interpolates all of a frame's windows at once when available
+try:
+    import numpy
+except:
+    numpy = None
+
+def easing(name: str, fps: float):
+    if anims:
+        return anims.lut(name, int(DURATION * fps))
+    # without anims.py only ease_out_quad is available
+    return lambda t: 1 - (1-t)*(1-t)
+
+SETTINGS = [
+    "RESERVE", "DWIDTH", "FPS", "MIN_FPS", "DURATION", "MOMENTUM", "PARK", "RECONCILE", "BATCH", "BUDGET", "COMMAND_SOCKETS",
+    "INFLIGHT", "METRICS", "CONTROL", "SNAPSHOT", "SAVE", "RECORD", "EASING", "OVERVIEW_MODE", "BINDINGS",
+]
+# the settings as they were before any config was loaded
+DEFAULTS: dict = {}
+# settings whose default is None, the rest take the type of their default
+TYPES = {"FPS": (int, float), "RECORD": str}
+# settings that can't be 0 or less
+POSITIVE = {"DURATION", "MIN_FPS", "BATCH", "COMMAND_SOCKETS", "INFLIGHT", "RECONCILE", "SAVE"}
+SIDES = ("top", "right", "bottom", "left")
+
+def check(name: str, value) -> None:
+    # raises ValueError for a value the daemon couldn't run with
+    default = DEFAULTS[name]
+    kind = TYPES.get(name) or ((int, float) if isinstance(default, float) else type(default))
+    # toml booleans aren't numbers here
+    if isinstance(value, bool) != (kind is bool) or not isinstance(value, kind):
+        raise ValueError(f"{name.lower()} = {value!r} is the wrong type")
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        if value < 0 or (value == 0 and name in POSITIVE):
+            raise ValueError(f"{name.lower()} = {value!r} is out of range")
+    if name == "EASING" and anims and value not in anims.EASINGS:
+        raise ValueError(f"easing = {value!r} isn't in anims.EASINGS")
+    if name == "RESERVE":
+        for output, sides in value.items():
+            if not isinstance(sides, dict) or any(k not in SIDES for k in sides):
+                raise ValueError(f"reserve.{output} takes only {', '.join(SIDES)}")
+            for v in sides.values():
+                if isinstance(v, bool) or not isinstance(v, int):
+                    raise ValueError(f"reserve.{output} = {sides!r} needs whole pixels")
+    if name == "BINDINGS" and any(not isinstance(v, str) for v in value.values()):
+        raise ValueError("bindings are key = \"action\"")
+
+def load_config(path: str) -> bool:
+    # sets the globals from path, anything it leaves out goes back to its default
+    if not tomllib:
+        return False
+    try:
+        with open(path, "rb") as f:
+            config = tomllib.load(f)
+    except FileNotFoundError:
+        config = {}
+    except (OSError, tomllib.TOMLDecodeError) as e:
+        print(f"{path}: {e}", file = sys.stderr)
+        return False
+
+    g = globals()
+    if not DEFAULTS:
+        DEFAULTS.update((name, g[name]) for name in SETTINGS)
+    values = dict(DEFAULTS)
+    try:
+        for key, value in config.items():
+            name = key.upper()
+            if name not in values:
+                print(f"{path}: unknown setting {key}", file = sys.stderr)
+                continue
+            check(name, value)
+            if name == "RESERVE":
+                # each output's sides fall back to "*", which falls back to the default
+                base = {**DEFAULTS[name]["*"], **value.get("*", {})}
+                value = {**DEFAULTS[name], **{k: {**base, **v} for k, v in value.items()}, "*": base}
+            elif name == "BINDINGS":
+                # merged into the defaults, an empty action unbinds a default key
+                value = {**DEFAULTS[name], **value}
+            values[name] = value
+    except ValueError as e:
+        print(f"{path}: {e}, keeping the current settings", file = sys.stderr)
+        return False
+    values["BINDINGS"] = {k: v for k, v in values["BINDINGS"].items() if v}
+    g.update(values)
+    return True
+
+def settings() -> dict:
+    g = globals()
+    return {name: g[name] for name in SETTINGS}
+
+# new animations start at clock(), replay.py swaps in the recorded time
+clock = time.time
+
+# x, y, width, height as sent to sway
+Geo = tuple[int, int, int, int]
+
+def overlaps(geo: Geo, r: Rect) -> bool:
+    x, y, w, h = geo
+    return x < r.x + r.width and r.x < x + w and y < r.y + r.height and r.y < y + h
+
+def offscreen(a: Geo, b: Geo, r: Rect) -> bool:
+    # the whole way from a to b stays off r
+    x, y = min(a[0], b[0]), min(a[1], b[1])
+    return not overlaps((x, y, max(a[0]+a[2], b[0]+b[2]) - x, max(a[1]+a[3], b[1]+b[3]) - y), r)
+
+def diff(old: dict, new: dict) -> dict:
+    # what changed from old to new as a json merge patch, None marks a removed key
+    out = {}
+    for k, v in new.items():
+        if k not in old:
+            out[k] = v
+        elif isinstance(v, dict) and isinstance(old[k], dict):
+            d = diff(old[k], v)
+            if d:
+                out[k] = d
+        elif old[k] != v:
+            out[k] = v
+    for k in old:
+        if k not in new:
+            out[k] = None
+    return out
+
+def con_rect(con: Con) -> Geo:
+    return (
+        con.rect.x, 
+        con.rect.y - con.deco_rect.height, 
+        con.rect.width, 
+        con.rect.height + con.deco_rect.height
+    )
+
+class Pipe:
+    # a command socket that doesn't wait for replies, they're read back in order as they arrive
+    def __init__(self, path: str, size: int) -> None:
+        self.path = path
+        self.slots = asyncio.Semaphore(size)
+        self.inflight = 0
+        # when each unanswered message was sent, and where to record its latency
+        self.sent: deque[tuple[float, Metrics | None]] = deque()
+        # commands sway refused, with or without metrics
+        self.failed = 0
+
+    async def connect(self) -> "Pipe":
+        self.reader, self.writer = await asyncio.open_unix_connection(self.path)
+        return self
+
+    async def command(self, payload: str, metrics: Metrics | None = None) -> None:
+        # only waits when sway is already INFLIGHT messages behind
+        await self.slots.acquire()
+        self.inflight += 1
+        self.sent.append((time.perf_counter(), metrics))
+        data = payload.encode()
+        self.writer.write(b"i3-ipc" + struct.pack("=II", len(data), 0) + data)
+
+    async def drain(self) -> None:
+        while True:
+            _, length, _ = struct.unpack("=6sII", await self.reader.readexactly(14))
+            replies = json.loads(await self.reader.readexactly(length))
+            start, metrics = self.sent.popleft()
+            self.inflight -= 1
+            self.slots.release()
+            # windows closed mid animation fail here too, so these are counted rather than raised
+            errors = [r.get("error") for r in replies if not r.get("success")]
+            if errors:
+                # the first and then one per 100 more, closing windows alone shouldn't flood the log
+                if self.failed == 0 or self.failed // 100 != (self.failed + len(errors)) // 100:
+                    print(f"sway refused a frame command ({self.failed + len(errors)} so far): {errors[0]}", file = sys.stderr)
+                self.failed += len(errors)
+            if metrics:
+                metrics.command(time.perf_counter() - start)
+                metrics.failed += len(errors)
+
+class Pool:
+    # one per output, so a slow output only waits on its own replies
+    def __init__(self, path: str, size: int) -> None:
+        self.pipes = [Pipe(path, INFLIGHT) for _ in range(max(size, 1))]
+        self.recorder = None
+        self.tasks: list[asyncio.Task] = []
+
+    async def connect(self) -> "Pool":
+        for p in self.pipes:
+            await p.connect()
+        return self
+
+    def close(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+        for p in self.pipes:
+            p.writer.close()
+
+    async def command(self, payload: str, key: int = 0, metrics: Metrics | None = None) -> None:
+        # the same key always uses the same socket, so its messages reach sway in order
+        if self.recorder:
+            self.recorder.write("command", "frame", payload)
+        await self.pipes[key % len(self.pipes)].command(payload, metrics)
 
 class Node: 
+    __slots__ = ("next", "prev", "parent")
+
     def __init__(self)-> None: 
         self.next: Node | None = None
         self.prev: Node | None = None
+        # the list this node is currently in
+        self.parent: LinkedList | None = None
 
 class LinkedList:
     def __init__(self) -> None:
         self.stack: Node | None = None
         self.size = 0
+
+    def __iter__(self):
+        cur = self.stack
+        while cur:
+            yield cur
+            cur = cur.next
     
     def add(self, new: Node, root: Node | None = None) -> None: 
         self.size += 1
+        new.parent = self
         if root:
             new.prev = root
             new.next = root.next
@@ -49,6 +312,7 @@ class LinkedList:
 
     def remove(self, node: Node) -> None:
         self.size -= 1
+        node.parent = None
         if node.prev:
             node.prev.next = node.next
         else:
@@ -78,13 +342,23 @@ class LinkedList:
             print(cur, end = ' ')
             cur = cur.next
 
-class Window(Rect, Node):
+class Window(Node):
+    __slots__ = ("id", "x", "y", "width", "height", "sent", "shown")
+
     def __init__(self, data, id):
         self.id: int = id
         self.next: Window | None
         self.prev: Window | None
+        self.parent: Container | None
+        # geometry of the last completed animation, None until first placed
+        self.sent: Geo | None = None
+        # geometry currently on screen, as far as we know
+        self.shown: Geo = (0, 0, 0, 0)
         Node.__init__(self)
-        Rect.__init__(self, data)
+        self.x = data["x"]
+        self.y = data["y"]
+        self.width = data["width"]
+        self.height = data["height"]
 
     def __eq__(self, other):
         if not other:
@@ -111,62 +385,382 @@ class Window(Rect, Node):
         if height is not None:
             self.height = height - 2*margin
 
-    async def move(self, i3: Connection, a: Rect, dx: float, dy:int=0) -> None:
-        x = a.x + (self.x-a.x)*dx
-        y = a.y + ((self.y+dy)-a.y)*dx
-        width = a.width + (self.width-a.width)*dx
-        height = a.height + (self.height-a.height)*dx
-
-        await i3.command(f"[con_id={self.id}] resize set width {int(width)}px height {int(height)}px")
-        await i3.command(f"[con_id={self.id}] move absolute position {int(x)}px {int(y)}px")
+    def target(self, dy: int = 0) -> Geo:
+        return (int(self.x), int(self.y+dy), int(self.width), int(self.height))
+
+    def frame(self, geo: Geo) -> tuple[str, int]:
+        # only what changed since the last frame, and how many of the two commands that left out
+        x, y, width, height = geo
+        cmds = []
+        resized = (width, height) != self.shown[2:]
+        if resized:
+            cmds.append(f"resize set width {width}px height {height}px")
+        # sway resizes floating windows around their centre, the move pins the corner back
+        if resized or (x, y) != self.shown[:2]:
+            cmds.append(f"move absolute position {x}px {y}px")
+        self.shown = (x, y, width, height)
+
+        if not cmds:
+            return "", 2
+        return f"[con_id={self.id}] " + ", ".join(cmds), 2 - len(cmds)
 
     async def focus(self, i3:Connection) -> None: 
         await i3.command(f"[con_id={self.id}] focus")
 
-    async def move_win(self, i3:Connection, tree, dy=0): 
-        global animid
-        aid = animid
-        win = tree.find_by_id(self.id)
-        if not win:
-            print("WTF")
-            exit(1)
-        win.rect.y -= win.deco_rect.height
-        win.rect.height += win.deco_rect.height
+def slope(ease, u: float) -> float:
+    e = 1/256
+    a, b = max(u-e, 0), min(u+e, 1)
+    return (ease(b) - ease(a)) / (b - a)
 
-        start = time.time()
-        frames = int(DURATION * FPS)
+class Anims:
+    # running animations as rows of flat arrays (start, target and kick rects, start times),
+    # with numpy one frame of every window is interpolated in a single pass
+    # kick is px added along u(1-u)^2, which has slope 1 at the start and is 0 at both ends,
+    # so a retargeted window keeps the speed it had
+    # prio is the column distance from focus, waited the frames since the window was last sent
+    __slots__ = ("wins", "targets", "rows", "start", "target", "kick", "t0", "prio", "waited")
 
-        for _ in range(frames): 
-            fstart = time.time()
-            t = (fstart - start) / DURATION
-            dx = DX(t)
-
-            if t >= 1:
-                dx = 1
+    def __init__(self) -> None:
+        self.wins: list[Window] = []
+        self.targets: list[Geo] = []
+        # row of each animated window by id
+        self.rows: dict[int, int] = {}
+        self.start = array("d")
+        self.target = array("d")
+        self.kick = array("d")
+        self.t0 = array("d")
+        self.prio: list[float] = []
+        self.waited: list[int] = []
+
+    def __contains__(self, id: int) -> bool:
+        return id in self.rows
+
+    def __len__(self) -> int:
+        return len(self.wins)
+
+    def get(self, id: int) -> Geo | None:
+        row = self.rows.get(id)
+        return None if row is None else self.targets[row]
+
+    def set(self, win: Window, start: Geo, target: Geo, t0: float, kick = (0., 0., 0., 0.), prio: float = 0) -> None:
+        row = self.rows.get(win.id)
+        if row is None:
+            self.rows[win.id] = len(self.wins)
+            self.wins.append(win)
+            self.targets.append(target)
+            self.start.extend(start)
+            self.target.extend(target)
+            self.kick.extend(kick)
+            self.t0.append(t0)
+            self.prio.append(prio)
+            self.waited.append(0)
+            return
+        i = 4*row
+        self.targets[row] = target
+        self.start[i:i+4] = array("d", start)
+        self.target[i:i+4] = array("d", target)
+        self.kick[i:i+4] = array("d", kick)
+        self.t0[row] = t0
+        self.prio[row] = prio
+
+    def remove(self, id: int) -> None:
+        # the last row moves into the gap
+        row = self.rows.pop(id, None)
+        if row is None:
+            return
+        last = len(self.wins) - 1
+        if row != last:
+            moved = self.wins[last]
+            self.rows[moved.id] = row
+            self.wins[row] = moved
+            self.targets[row] = self.targets[last]
+            for a in (self.start, self.target, self.kick):
+                a[4*row:4*row+4] = a[4*last:4*last+4]
+            self.t0[row] = self.t0[last]
+            self.prio[row] = self.prio[last]
+            self.waited[row] = self.waited[last]
+        self.wins.pop()
+        self.targets.pop()
+        for a in (self.start, self.target, self.kick):
+            del a[4*last:]
+        self.t0.pop()
+        self.prio.pop()
+        self.waited.pop()
+
+    def clear(self) -> None:
+        self.__init__()
+
+    def speed(self, id: int, now: float, ease) -> tuple[float, float, float, float]:
+        row = self.rows[id]
+        u = (now - self.t0[row]) / DURATION
+        if u >= 1:
+            return (0., 0., 0., 0.)
+        m = slope(ease, u)
+        hd = (1-u) * (1-3*u)
+        i = 4*row
+        return tuple(
+            ((self.target[k] - self.start[k])*m + self.kick[k]*hd) / DURATION for k in range(i, i+4)
+        ) # type: ignore
+
+    def pick(self, budget: int) -> list[int]:
+        # rows by priority, each frame a window waits counts as one column closer
+        n = len(self.wins)
+        if not budget or n <= budget:
+            return list(range(n))
+        prio, waited = self.prio, self.waited
+        return sorted(range(n), key = lambda row: prio[row] - waited[row])
+
+    def at(self, now: float, ease) -> tuple[list[Geo], list[int]]:
+        # every window's geometry at now, and the rows that reached their target
+        n = len(self.wins)
+        if not n:
+            return [], []
+        if numpy:
+            start = numpy.frombuffer(self.start).reshape(n, 4)
+            target = numpy.frombuffer(self.target).reshape(n, 4)
+            u = (now - numpy.frombuffer(self.t0)) / DURATION
+            done = u >= 1
+            u = numpy.clip(u, 0, 1)
+            dx = ease.many(u) if hasattr(ease, "many") else ease(u)
+            h = u * (1-u) * (1-u)
+            geo = start + (target - start) * dx[:, None] + numpy.frombuffer(self.kick).reshape(n, 4) * h[:, None]
+            geo[done] = target[done]
+            return geo.astype(int).tolist(), numpy.flatnonzero(done).tolist()
+
+        geos: list[Geo] = []
+        done = []
+        for row in range(n):
+            u = (now - self.t0[row]) / DURATION
+            if u >= 1:
+                geos.append(self.targets[row])
+                done.append(row)
+                continue
+            dx = ease(u)
+            h = u * (1-u) * (1-u)
+            i = 4*row
+            geos.append(tuple(
+                int(self.start[k] + (self.target[k] - self.start[k])*dx + self.kick[k]*h) for k in range(i, i+4)
+            )) # type: ignore
+        return geos, done
+
+class Animator:
+    def __init__(self, pool: Pool, layout, metrics: Metrics | None = None) -> None:
+        self.pool = pool
+        # called at the start of a frame when a retarget was requested
+        self.layout = layout
+        self.pending = False
+        self.metrics = metrics
+        self.anims = Anims()
+        self.wake = asyncio.Event()
+        self.next: float = 0
+        # when the last frame was sent
+        self.last: float = 0
+        self.ease = EASING
+        self.set_fps(FPS or 60)
+
+    def set_fps(self, fps: float) -> None:
+        self.fps = fps
+        # frames are paced at fps / div, div grows while frames cost more than they're given
+        self.div = 1
+        self.cost: float = 0
+        self.over = 0
+        self.under = 0
+        # the easing table is per frame at this fps, so this is also where a new ease takes effect
+        self.dx = easing(self.ease, fps)
+
+    @property
+    def rate(self) -> float:
+        return self.fps / self.div
+
+    def pace(self, cost: float) -> None:
+        self.cost += (cost - self.cost) * 0.2
+        if self.cost > 0.9 / self.rate and self.fps / (self.div+1) >= MIN_FPS:
+            self.over += 1
+            self.under = 0
+            if self.over >= 5:
+                self.div += 1
+                self.over = 0
+        elif self.div > 1 and self.cost < 0.5 * (self.div - 1) / self.fps:
+            # would still fit comfortably at the next rate up
+            self.under += 1
+            self.over = 0
+            if self.under >= 60:
+                self.div -= 1
+                self.under = 0
+        else:
+            self.over = 0
+            self.under = 0
+
+    def dirty(self, win: Window, target: Geo) -> bool:
+        running = self.anims.get(win.id)
+        if running:
+            return running != target
+        return win.sent != target
+
+    def request(self) -> None:
+        # any number of requests before the next frame are one retarget
+        self.pending = True
+        self.wake.set()
+
+    def animate(self, win: Window, target: Geo, prio: float = 0) -> None:
+        # replaces any running animation of win, starting where it is now
+        if win.id not in self.anims:
+            self.anims.set(win, win.shown, target, clock(), prio = prio)
+            self.wake.set()
+            return
 
-            if aid != animid:
-                return
+        # shown is where the last frame left it, so continue from that time
+        kick = (0., 0., 0., 0.)
+        if MOMENTUM:
+            m = slope(self.dx, 0)
+            kick = tuple(
+                v*MOMENTUM*DURATION - (t-s)*m 
+                for v, s, t in zip(self.anims.speed(win.id, self.last, self.dx), win.shown, target)
+            )
+        self.anims.set(win, win.shown, target, self.last, kick, prio)
 
-            await self.move(i3, win.rect, dx, dy)
-            
-            if t >= 1:
-                return 
+    def place(self, win: Window, target: Geo, prio: float = 0) -> None:
+        # sent once at the next frame rather than animated
+        self.anims.set(win, target, target, clock() - DURATION, prio = prio)
+        self.wake.set()
 
-            await asyncio.sleep(max(1/FPS-(fstart-time.time()), 0))
+    def cancel(self, win: Window | None = None) -> None:
+        if win is None:
+            self.anims.clear()
+        else:
+            self.anims.remove(win.id)
+
+    async def command_batch(self, cmds: list[tuple[int, str]]) -> None:
+        # one ipc write per BATCH windows rather than two per window, replies aren't waited for
+        # a window always uses the same socket, so its frames reach sway in order
+        n = len(self.pool.pipes)
+        for key in range(n):
+            mine = [cmd for id, cmd in cmds if id % n == key]
+            for i in range(0, len(mine), BATCH):
+                await self.pool.command("; ".join(mine[i:i+BATCH]), key, self.metrics)
+
+    async def tick(self, now: float) -> None:
+        cmds = []
+        skipped = 0
+        geos, done = self.anims.at(now, self.dx)
+        wins, waited = self.anims.wins, self.anims.waited
+        # rows past the budget keep their place and are sent from where they are by then,
+        # last frames are always sent so every animation still ends after DURATION
+        ending = set(done)
+        deferred = 0
+        for row in self.anims.pick(BUDGET):
+            if BUDGET and len(cmds) >= BUDGET and row not in ending:
+                waited[row] += 1
+                deferred += 1
+                continue
+            cmd, s = wins[row].frame(geos[row])
+            skipped += s
+            waited[row] = 0
+            if cmd:
+                cmds.append((wins[row].id, cmd))
+
+        # from the end, so rows moved into the gaps are ones still running
+        for row in reversed(done):
+            win = wins[row]
+            win.sent = self.anims.targets[row]
+            self.anims.remove(win.id)
+
+        if self.metrics:
+            self.metrics.skipped += skipped
+            self.metrics.deferred += deferred
+            if cmds:
+                self.metrics.first_frame()
+        await self.command_batch(cmds)
+
+    async def run(self) -> None:
+        while True:
+            if not self.anims and not self.pending:
+                self.wake.clear()
+                await self.wake.wait()
+                self.next = 0
+            # from idle, including a first pass that already has a layout pending, frames count from now
+            if not self.next:
+                self.next = time.time()
+
+            if self.pending:
+                self.pending = False
+                self.layout()
+
+            start = time.time()
+            self.last = start
+            await self.tick(start)
+            cost = time.time() - start
+            rate = self.rate
+            if self.metrics:
+                self.metrics.frame(cost, start - self.next, 1/rate)
+                self.metrics.fps = rate
+            # interpolation is by time, so a lower rate keeps the same DURATION
+            self.pace(cost)
+
+            self.next += 1/rate
+            now = time.time()
+            # dropped frames are skipped rather than sent late
+            if now > self.next:
+                skipped = math.ceil((now - self.next) * rate)
+                self.next += skipped / rate
+                if self.metrics:
+                    self.metrics.dropped += skipped
+            await asyncio.sleep(self.next - now)
 
 class Container(Node, LinkedList): 
-    def __init__(self):
+    def __init__(self, width: int):
         self.next: Container | None
         self.prev: Container | None
+        self.parent: Workspace | None
         self.stack: Window | None
         Node.__init__(self)
         LinkedList.__init__(self)
-        self.width: int = SCREEN.width//2
+        # x it was last organised at, and whether its windows need organising regardless
+        self.x: float | None = None
+        self.dirty: bool = True
+        # index in parent.cols
+        self.col: int = 0
+        self.width: int = width
+
+    @property
+    def width(self) -> int:
+        return self._width
+
+    @width.setter
+    def width(self, width: int) -> None:
+        self._width = width
+        self.dirty = True
+        if self.parent:
+            self.parent.resized(self)
+
+    def touch(self) -> None:
+        self.dirty = True
+        if self.parent:
+            self.parent.touched(self)
+
+    def add(self, new: Node, root: Node | None = None) -> None:
+        LinkedList.add(self, new, root)
+        self.touch()
+
+    def remove(self, node: Node) -> None:
+        LinkedList.remove(self, node)
+        self.touch()
+
+    def swap(self, a: Node, b: Node) -> None:
+        LinkedList.swap(self, a, b)
+        self.touch()
+
+    async def organise(self, x: float) -> None:
+        if x == self.x and not self.dirty:
+            return
+        self.x = x
+        self.dirty = False
+        self.parent.parked = None # type: ignore
 
-    async def organise(self, x: int) -> None:
+        screen = self.parent.screen # type: ignore
         # theres an annoying edge case I can't fix
-        height = SCREEN.height // self.size
-        p = SCREEN.y + SCREEN.height
+        height = screen.height // self.size
+        p = screen.y + screen.height
         cur = self.stack
         while cur: 
             p -= height
@@ -178,14 +772,6 @@ class Container(Node, LinkedList):
             )
             cur = cur.next
 
-    async def has_win(self, id) -> Window | None: 
-        cur = self.stack
-        while cur:
-            if cur.id == id:
-                return cur
-            cur = cur.next
-        return None
-
 class Workspace(Node, LinkedList):
     def __init__(self):
         self.anchor: Container | None = None
@@ -193,21 +779,76 @@ class Workspace(Node, LinkedList):
         # 0 is left, 1 is right
         self.anchordir: float = 0
 
+        # containers in order and offsets[i], the width of cols[:i], rebuilt lazily
+        self.cols: list[Container] | None = None
+        self.offsets: list[int] = [0]
+        # offsets from this index on are out of date
+        self.stale: int = 0
+        # P the columns were last organised at, and the first column that may have moved or
+        # changed since, columns before it are where they were
+        self.placed: float | None = None
+        self.moved: int = 0
+        # dy its windows were last put at while it wasn't visible, None once anything moved
+        self.parked: int | None = None
+
         self.stack: Container | None
         self.next: Workspace | None
         self.prev: Workspace | None
+        self.parent: Output | None
         Node.__init__(self)
         LinkedList.__init__(self)
 
-    async def cont_with_win(self, id: int) -> tuple[Container, Window] | None:
-        cur = self.stack
+    @property
+    def screen(self) -> Rect:
+        return self.parent.screen # type: ignore
 
+    def reflow(self) -> None:
+        # the screen changed under every container
+        cur = self.stack
         while cur:
-            win = await cur.has_win(id)
-            if win:
-                return (cur, win)
+            cur.dirty = True
             cur = cur.next
-        return None
+        self.moved = 0
+
+    def add(self, new: Node, root: Node | None = None) -> None:
+        LinkedList.add(self, new, root)
+        self.cols = None
+
+    def remove(self, node: Node) -> None:
+        LinkedList.remove(self, node)
+        self.cols = None
+
+    def swap(self, a: Container, b: Container) -> None:
+        LinkedList.swap(self, a, b)
+        if self.cols is not None:
+            self.cols[a.col], self.cols[b.col] = b, a
+            a.col, b.col = b.col, a.col
+            self.stale = min(self.stale, a.col, b.col)
+
+    def resized(self, cont: Container) -> None:
+        self.stale = min(self.stale, cont.col)
+
+    def touched(self, cont: Container) -> None:
+        # col is only meaningful while cols is, a rebuild organises from the start anyway
+        if self.cols is not None:
+            self.moved = min(self.moved, cont.col)
+
+    def columns(self) -> list[Container]:
+        if self.cols is None:
+            self.cols = []
+            cur = self.stack
+            while cur:
+                cur.col = len(self.cols)
+                self.cols.append(cur)
+                cur = cur.next
+            self.offsets = [0] * (len(self.cols) + 1)
+            self.stale = 0
+
+        self.moved = min(self.moved, self.stale)
+        for i in range(self.stale, len(self.cols)):
+            self.offsets[i+1] = self.offsets[i] + self.cols[i].width
+        self.stale = len(self.cols)
+        return self.cols
 
     async def focus_cont(self, cont: Container) -> None:
         if not self.anchor: 
@@ -215,19 +856,19 @@ class Workspace(Node, LinkedList):
             self.anchordir = 0
             self.focus = cont
 
+        self.columns()
+        off = self.offsets
+        screen = self.screen
+
         # if left of screen has space, anchor at start
         if self.anchordir == 1:
-            width = 0
-            cur = self.anchor
-            while cur: 
-                width += cur.width
-                cur = cur.prev
-
-            if width <= SCREEN.width: 
+            if off[self.anchor.col + 1] <= screen.width: 
                 if self.stack:
                     await self.anchor_set(self.stack, 0)
         
-        P = self.anchordir * SCREEN.width + SCREEN.x
+        P = self.anchordir * screen.width + screen.x
+        a = self.anchor.col
+        c = cont.col
 
         # if window is too off, anchor there
         for d in [-1, 1]:
@@ -236,18 +877,17 @@ class Workspace(Node, LinkedList):
             if self.anchordir == 0.5:
                 p += -1*d*self.anchor.width//2
 
-            cur = self.anchor
-            while cur:
-                p += cur.width * d
-                if cur == cont: 
-                    if p > SCREEN.x + SCREEN.width or p < SCREEN.x:
-                        await self.anchor_set(cur, (d + 1) // 2) 
-                        return
-                    break
-                if d > 0:
-                    cur = cur.next
-                else:
-                    cur = cur.prev
+            # from the anchor's far edge to cont's far edge, walking in d
+            if d > 0 and c >= a:
+                p += off[c+1] - off[a]
+            elif d < 0 and c <= a:
+                p -= off[a+1] - off[c]
+            else:
+                continue
+
+            if p > screen.x + screen.width or p < screen.x:
+                await self.anchor_set(cont, (d + 1) // 2) 
+                return
         
         # it's all chill, set anim anyway
         await self.anchor_set(self.anchor, self.anchordir)
@@ -260,249 +900,68 @@ class Workspace(Node, LinkedList):
         if not self.anchor: 
             return
 
-        P = (SCREEN.width * adir + SCREEN.x) - (adir*cont.width)
-        for d in [1, -1]:
-            p = P
-            cur = self.anchor
-            while cur: 
-                if d == -1 and cur == self.anchor:
-                    cur = cur.prev
-                    continue
-                if d == -1:
-                    p -= cur.width
-                    await cur.organise(p)
-                else:
-                    await cur.organise(p)
-                    p += cur.width
-
-                if d > 0:
-                    cur = cur.next
-                else:
-                    cur = cur.prev
-
-
-class Niri(LinkedList):
-    def __init__(self):
+        cols = self.columns()
+        screen = self.screen
+        P = (screen.width * adir + screen.x) - (adir*cont.width) - self.offsets[cont.col]
+        # with the same P, columns before the first changed one haven't moved and aren't visited,
+        # of the rest only those whose position, width or windows changed touch their windows
+        start = self.moved if P == self.placed else 0
+        self.placed = P
+        self.moved = len(cols)
+        off = self.offsets
+        for i in range(start, len(cols)):
+            await cols[i].organise(P + off[i])
+
+
+class Output(LinkedList):
+    def __init__(self, i3: Connection, pool: Pool, name: str, rect: Rect, refresh: float, changed):
         self.stack: Workspace
         LinkedList.__init__(self)
+        self.i3 = i3
+        # called after each layout, so at most once a frame
+        self.changed = changed
+        self.name = name
+        self.rect = rect
+        self.refresh = refresh
+        self.screen = rect
+        # offsets that put a window above or below every output
+        self.above = -rect.height
+        self.below = rect.height
+        # rects of the other outputs, columns scrolled onto them are hidden below instead
+        self.others: list[Rect] = []
+        self.resize(rect)
+
+        self.metrics = Metrics() if METRICS else None
+        self.animator = Animator(pool, self.retarget, self.metrics)
+        if not FPS:
+            self.animator.set_fps(refresh or 60)
         self.add(Workspace())
         self.current: Workspace = self.stack
-
-    async def setup(self): 
-        self.i3 = await Connection().connect()
-
-        await self.i3.command("mouse_warping none")
-        await self.i3.command("bindsym Mod4+k mark '_up'")
-        await self.i3.command("bindsym Mod4+j mark '_down'")
-        await self.i3.command("bindsym Mod4+h mark '_left'")
-        await self.i3.command("bindsym Mod4+l mark '_right'")
-        await self.i3.command("bindsym Mod4+equal mark '_incwidth'")
-        await self.i3.command("bindsym Mod4+minus mark '_decwidth'")
-        await self.i3.command("bindsym Mod4+Ctrl+h mark '_moveleft'")
-        await self.i3.command("bindsym Mod4+Ctrl+l mark '_moveright'")
-        await self.i3.command("bindsym Mod4+Shift+h mark '_swapleft'")
-        await self.i3.command("bindsym Mod4+Shift+l mark '_swapright'")
-        await self.i3.command("bindsym Mod4+Shift+j mark '_movedown'")
-        await self.i3.command("bindsym Mod4+Shift+k mark '_moveup'")
-        await self.i3.command("bindsym Mod4+c mark '_center'")
-        await self.i3.command("bindsym Mod4+Shift+c mark '_fullwidth'")
-
-        self.i3.on(Event.WINDOW_FOCUS, self.focus_win) # type: ignore
-        self.i3.on(Event.WINDOW_CLOSE, self.close_win) # type: ignore
-        self.i3.on(Event.WINDOW_MARK, self.mark_win) # type: ignore
-        # self.i3.on(Event.WORKSPACE_FOCUS, self.focus_workspace) # type: ignore
-
-        await self.i3.main()
-
-    async def add_win(self, e:WindowEvent) -> None:
-        await e.container.command("floating enable")  #type: ignore
-        ncont:Container = Container()
-        new = Window(dict(
-            x = 0,
-            y = 0,
-            width = 100, 
-            height = 100
-        ), e.container.id) # type: ignore
-
-        ncont.add(new)
-        self.current.add(ncont, self.current.focus)
-        self.current.focus = ncont
-
-        await self.current.focus_cont(ncont)
-        await self.move_all()
-
-    async def focus_win(self, i3:Connection, e:WindowEvent) -> None: 
-        res = await self.workspace_with_win(e.container.id) # type: ignore
-        if not res: 
-            await self.add_win(e)
-            return
-        workspace, cont, _ = res
-        workspace.focus = cont
-        self.current = workspace
-        await workspace.focus_cont(cont)
-        await self.move_all()
-
-    async def close_win(self, i3:Connection, e:WindowEvent) -> None: 
-        res = await self.workspace_with_win(e.container.id) # type: ignore
-        if not res: 
-            return
-        workspace, cont, win = res
-        
-        if cont.size == 1:
-            fd = int(2*workspace.anchordir-1) * (-1 if cont != workspace.anchordir else 1)
-            new_focus = None
-            if fd < 0: 
-                if cont.prev: 
-                    new_focus = cont.prev
-                elif cont.next:
-                    new_focus = cont.next
-            else:
-                if cont.next: 
-                    new_focus = cont.next
-                elif cont.prev:
-                    new_focus = cont.prev
-            
-            if workspace.anchor == cont: 
-                workspace.anchor = new_focus
-
-            cont.remove(win)
-            workspace.remove(cont)
-            workspace.focus = new_focus
-
-            if new_focus and new_focus.stack and self.current == workspace: 
-                await new_focus.stack.focus(i3)
-        else: 
-            cont.remove(win)
-            if self.current == workspace:
-                if win.next:
-                    await win.next.focus(i3)
-                elif win.prev: 
-                    await win.prev.focus(i3)
-
-        # if workspace empty and not focused, delete it
-        if workspace.size == 0 and self.size > 1: 
-            self.remove(workspace)
-
-    async def mark_win(self, i3: Connection, e: WindowEvent) -> None: 
-        marks = e.container.marks
-
-        if len(marks) == 0:
-            return 
-
-        await e.container.command("unmark") # type: ignore
-
-        res = await self.workspace_with_win(e.container.id) # type: ignore
-        if not res:
-            return 
-        workspace, cont, win = res
-
-        if "_left" in marks:
-            if cont.prev and cont.prev.stack:
-                await cont.prev.stack.focus(i3)
-
-        if "_right" in marks: 
-            if cont.next and cont.next.stack: 
-                await cont.next.stack.focus(i3)
-
-        if "_down" in marks:
-            if win.prev and self.current == workspace: 
-                await win.prev.focus(i3)
-            else:
-                await self.workspace_down()
-
-        if "_up" in marks:
-            if win.next and self.current == workspace:
-                await win.next.focus(i3)
-            else:
-                await self.workspace_up()
-
-        if "_decwidth" in marks:
-            cont.width -= DWIDTH
-            cont.width = max(cont.width, 150)
-            await workspace.focus_cont(cont)
-            await self.move_all()
-
-        if "_incwidth" in marks: 
-            cont.width += DWIDTH
-            cont.width = min(cont.width, SCREEN.width)
-            await workspace.focus_cont(cont)
-            await self.move_all()
-
-        if "_fullwidth" in marks:
-            cont.width = SCREEN.width
-            await workspace.focus_cont(cont)
-            await self.move_all()
-
-        if "_moveleft" in marks:
-            cont.remove(win)
-            if cont.size == 0: 
-                if cont.prev: 
-                    workspace.remove(cont)
-                    cont.prev.add(win)
-                    if workspace.anchor == cont: 
-                        workspace.anchor = cont.prev
-                    await workspace.focus_cont(cont.prev)
-                    await self.move_all()
-            else:
-                ncont: Container = Container() # type: ignore
-                ncont.add(win)
-                workspace.add(ncont, cont.prev)
-                await workspace.focus_cont(ncont)
-                await self.move_all()
-
-        if "_moveright" in marks:
-            cont.remove(win)
-            if cont.size == 0: 
-                if cont.next: 
-                    workspace.remove(cont)
-                    cont.next.add(win)
-                    if workspace.anchor == cont: 
-                        workspace.anchor = cont.prev
-                    await workspace.focus_cont(cont.next)
-                    await self.move_all()
-            else:
-                ncont: Container = Container() 
-                ncont.add(win)
-                workspace.add(ncont, cont)
-                await workspace.focus_cont(ncont)
-                await self.move_all()
-
-        if "_swapleft" in marks:
-            if cont.prev:
-                if workspace.anchor == cont: 
-                    workspace.anchor = cont.prev
-                workspace.swap(cont.prev, cont)
-                await workspace.focus_cont(cont)
-                await self.move_all()
-        
-        if "_swapright" in marks:
-            if cont.next:
-                if workspace.anchor == cont: 
-                    workspace.anchor = cont.next
-                workspace.swap(cont, cont.next)
-                await workspace.focus_cont(cont)
-                await self.move_all()
-
-        if "_moveup" in marks:
-            if win.next:
-                cont.swap(win, win.next)
-                await workspace.focus_cont(cont)
-                await self.move_all()
-            # This does not work yet, and I don't know why. If you do find out, please let me know
-            # else: 
-            #     await self.workspace_move_up()
-
-        if "_movedown" in marks:
-            if win.prev:
-                cont.swap(win.prev, win)
-                await workspace.focus_cont(cont)
-                await self.move_all()
-            # else: 
-            #     await self.workspace_move_down()
-
-        if "_center" in marks:
-            await workspace.anchor_set(cont, 0.5)
-            await self.move_all()
+        # current as of the last layout, and the workspace that was before it
+        self.visible: Workspace = self.stack
+        self.leaving: Workspace | None = None
+        # every workspace scaled into a row of the screen, and whether the next layout is its way out
+        self.overview = False
+        self.unzoom = False
+
+    def resize(self, rect: Rect) -> None:
+        self.rect = rect
+        r = RESERVE.get(self.name, RESERVE["*"])
+        self.screen = Rect(dict(
+            x = rect.x + r["left"],
+            y = rect.y + r["top"],
+            width = rect.width - r["left"] - r["right"],
+            height = rect.height - r["top"] - r["bottom"]
+        ))
+
+    async def relayout(self) -> None:
+        cur = self.stack
+        while cur:
+            cur.reflow()
+            if cur.anchor:
+                await cur.anchor_set(cur.anchor, cur.anchordir)
+            cur = cur.next
+        self.move_all()
 
     async def focus_workspace(self, i3: Connection, e: WorkspaceEvent): 
         try:
@@ -517,7 +976,7 @@ class Niri(LinkedList):
                 if self.current.focus and self.current.focus.stack:
                     await self.current.focus.stack.focus(self.i3)
                 else:
-                    await self.move_all()
+                    self.move_all()
                 return
             i += 1
             cur = cur.next
@@ -535,7 +994,7 @@ class Niri(LinkedList):
 
         if self.current.focus and self.current.focus.stack:
             await self.current.focus.stack.focus(self.i3)
-        await self.move_all()
+        self.move_all()
 
     async def workspace_up(self) -> None:
         if self.current.size != 0:
@@ -550,7 +1009,7 @@ class Niri(LinkedList):
 
         if self.current.focus and self.current.focus.stack:
             await self.current.focus.stack.focus(self.i3)
-        await self.move_all()
+        self.move_all()
 
     async def workspace_move_down(self) -> None:
         if not self.current.focus:
@@ -577,7 +1036,7 @@ class Niri(LinkedList):
 
         self.current.focus = focus
         await self.current.focus_cont(focus)
-        await self.move_all()
+        self.move_all()
 
     async def workspace_move_up(self):
         if not self.current.focus:
@@ -604,41 +1063,784 @@ class Niri(LinkedList):
 
         self.current.focus = focus
         await self.current.focus_cont(focus)
-        await self.move_all()
+        self.move_all()
+
+    def move_all(self) -> None:
+        self.animator.request()
+
+    def toggle_overview(self) -> None:
+        self.overview = not self.overview
+        self.unzoom = not self.overview
+        for ws in self:
+            ws.parked = None
+        self.move_all()
+
+    def zoom(self) -> float:
+        # one scale for every workspace, small enough that each fits in its row
+        widest = 1
+        for ws in self:
+            ws.columns()
+            widest = max(widest, ws.offsets[-1])
+        return min(1 / self.size, self.screen.width / widest)
+
+    def zoomed(self, win: Window, x0: float, y0: float, s: float) -> Geo:
+        cont: Container = win.parent # type: ignore
+        x = cont.parent.offsets[cont.col] + win.x - (cont.x or 0) # type: ignore
+        y = win.y - self.screen.y
+        return (int(x0 + x*s), int(y0 + y*s), int(win.width*s), int(win.height*s))
+
+    def retarget(self) -> None:
+        if self.current != self.visible:
+            self.leaving = self.visible
+            self.visible = self.current
+
+        # the way out of the overview animates every workspace, parked ones too
+        park = PARK and not self.overview and not self.unzoom
+        self.unzoom = False
+        if self.overview:
+            s = self.zoom()
+            screen = self.screen
+            row = screen.height / self.size
+
+        passed: bool = False
+        wscur = self.stack
+        n = 0
+        while wscur: 
+            if self.current == wscur:
+                passed = True
+            dy = 0
+            if self.current != wscur: 
+                dy = self.below if passed else self.above
+            if self.overview:
+                # centred in the workspace's row
+                x0 = screen.x + (screen.width - wscur.offsets[-1]*s) / 2
+                y0 = screen.y + n*row + (row - screen.height*s) / 2
+                n += 1
+
+            if park and wscur != self.current and wscur != self.leaving:
+                if wscur.parked != dy:
+                    self.park(wscur, dy)
+                wscur = wscur.next
+                continue
+
+            # animated in full, so wherever it was parked no longer holds
+            wscur.parked = None
+            # columns further from focus are sent last when a frame is over BUDGET
+            focus = 0
+            for i, ccur in enumerate(wscur):
+                if ccur == wscur.focus:
+                    focus = i
+            ccur = wscur.stack
+            i = 0
+            while ccur:
+                prio = abs(i - focus) + (wscur != self.current)
+                wcur = ccur.stack
+                while wcur:
+                    if self.overview:
+                        target = self.zoomed(wcur, x0, y0, s)
+                    else:
+                        d = dy
+                        if not d and self.others and any(overlaps(wcur.target(), r) for r in self.others):
+                            d = self.below
+                        target = wcur.target(d)
+                    if not self.animator.dirty(wcur, target):
+                        pass
+                    elif all(offscreen(wcur.shown, target, r) for r in (self.rect, *self.others)):
+                        # nothing of it would be seen moving
+                        self.animator.place(wcur, target, prio)
+                    else:
+                        self.animator.animate(wcur, target, prio)
+                    wcur = wcur.next
+                ccur = ccur.next
+                i += 1
+            wscur = wscur.next
+        self.changed()
+
+    def park(self, ws: Workspace, dy: int) -> None:
+        # windows off screen go straight to their place, windows still animating out finish first
+        moving = False
+        for cont in ws:
+            for win in cont:
+                target = win.target(dy)
+                if not self.animator.dirty(win, target):
+                    moving = moving or win.id in self.animator.anims
+                elif win.id in self.animator.anims:
+                    self.animator.animate(win, target)
+                    moving = True
+                else:
+                    self.animator.place(win, target)
+        ws.parked = None if moving else dy
+
+class Niri:
+    def __init__(self):
+        self.outputs: dict[str, Output] = {}
+        # output new windows go to when their position doesn't say
+        self.focused: Output | None = None
+        # every managed window by con id
+        self.windows: dict[int, Window] = {}
+        self.focused_win: int | None = None
+        self.recorder = None
+        self.actions = {
+            "up": self.act_up,
+            "down": self.act_down,
+            "left": self.act_left,
+            "right": self.act_right,
+            "incwidth": self.act_incwidth,
+            "decwidth": self.act_decwidth,
+            "moveleft": self.act_moveleft,
+            "moveright": self.act_moveright,
+            "swapleft": self.act_swapleft,
+            "swapright": self.act_swapright,
+            "movedown": self.act_movedown,
+            "moveup": self.act_moveup,
+            "center": self.act_center,
+            "fullwidth": self.act_fullwidth,
+            "overview": self.act_overview,
+        }
+        # control connections subscribed to state changes, and the state they last got
+        self.streams: set[asyncio.StreamWriter] = set()
+        self.state: dict = {}
+        # loop time of the last publish, and whether one is already waiting for the next frame
+        self.published: float = 0
+        self.publishing = False
+
+    async def setup(self):
+        load_config(CONFIG)
+        # events and the commands that handle them never queue behind frames
+        if RECORD:
+            from replay import Recorder, RecordingConnection
+            self.recorder = Recorder(RECORD)
+            self.recorder.write("settings", "", settings())
+            self.i3 = await RecordingConnection(self.recorder).connect()
+        else:
+            self.i3 = await Connection().connect()
+        await self.update_outputs()
+        await self.restore()
+
+        await self.bind({})
+
+        for event, handler in self.handlers().items():
+            if self.recorder:
+                handler = self.recorder.wrap(event, handler)
+            self.i3.on(event, handler) # type: ignore
+        # self.i3.on(Event.WORKSPACE_FOCUS, self.focus_workspace) # type: ignore
+
+        if os.path.exists(CONTROL):
+            os.unlink(CONTROL)
+        await asyncio.start_unix_server(self.control, CONTROL)
+
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, lambda: self.spawn(self.reload()))
+        await asyncio.gather(self.i3.main(), self.watch_drift(), self.persist(), self.watch_config())
+
+    async def bind(self, old: dict[str, str]) -> None:
+        # every key in one command, keys dropped from BINDINGS since old are released
+        cmds = ["mouse_warping none"] + [f"unbindsym {key}" for key in old if key not in BINDINGS]
+        cmds += [f"bindsym {key} nop snirifx {action}" for key, action in BINDINGS.items()]
+        await self.i3.command("; ".join(cmds))
+
+    async def reload(self) -> None:
+        old = BINDINGS
+        if not load_config(CONFIG):
+            return
+        if self.recorder:
+            self.recorder.write("settings", "", settings())
+        # a bad reload is reported and the daemon carries on with whatever did apply
+        try:
+            await self.apply(old)
+        except Exception as e:
+            print(f"{CONFIG}: reload failed: {e!r}", file = sys.stderr)
+
+    async def apply(self, old: dict[str, str]) -> None:
+        # the layout is kept, only where it's placed and how it animates changes
+        await self.bind(old)
+        for output in self.outputs.values():
+            output.resize(output.rect)
+            # set_fps rebuilds the easing table, which DURATION changes too
+            output.animator.ease = EASING
+            output.animator.set_fps(FPS or output.refresh)
+            await output.relayout()
+
+    def mtime(self) -> float | None:
+        try:
+            return os.stat(CONFIG).st_mtime
+        except OSError:
+            return None
+
+    async def watch_config(self) -> None:
+        last = self.mtime()
+        while True:
+            await asyncio.sleep(1)
+            mtime = self.mtime()
+            if mtime != last:
+                last = mtime
+                await self.reload()
+
+    def handlers(self) -> dict:
+        return {
+            Event.WINDOW_FOCUS: self.focus_win,
+            Event.WINDOW_CLOSE: self.close_win,
+            Event.WINDOW_MARK: self.mark_win,
+            Event.BINDING: self.binding,
+            Event.OUTPUT: self.output_changed,
+        }
+
+    def spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        task.add_done_callback(self.crashed)
+        return task
+
+    def crashed(self, task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception():
+            self.i3.main_quit(_error = task.exception())
+
+    async def connect_pool(self) -> Pool:
+        pool = await Pool(self.i3.socket_path, COMMAND_SOCKETS).connect()
+        pool.recorder = self.recorder
+        pool.tasks = [self.spawn(p.drain()) for p in pool.pipes]
+        return pool
+
+    async def update_outputs(self) -> None:
+        replies = [o for o in await self.i3.get_outputs() if o.active]
+        if not replies:
+            return
+
+        for o in replies:
+            # sway reports mHz, i3 has no modes
+            refresh = o.current_mode.refresh / 1000 if o.current_mode and o.current_mode.refresh else 60
+            output = self.outputs.get(o.name)
+            if not output:
+                pool = await self.connect_pool()
+                # output events are handled concurrently, another may have added it while this connected
+                output = self.outputs.get(o.name)
+                if output:
+                    pool.close()
+                else:
+                    output = Output(self.i3, pool, o.name, o.rect, refresh, self.changed)
+                    output.task = self.spawn(output.animator.run()) # type: ignore
+                    self.outputs[o.name] = output
+            elif (o.rect.x, o.rect.y, o.rect.width, o.rect.height) != (output.rect.x, output.rect.y, output.rect.width, output.rect.height):
+                output.resize(o.rect)
+                await output.relayout()
+            if o.focused or not self.focused:
+                self.focused = output
+
+        # workspaces of unplugged outputs move to the end of a remaining one
+        names = [o.name for o in replies]
+        for name in list(self.outputs):
+            if name in names:
+                continue
+            gone = self.outputs.pop(name)
+            gone.task.cancel() # type: ignore
+            gone.animator.pool.close()
+            if self.focused == gone:
+                self.focused = self.outputs[names[0]]
+            last = self.focused.stack
+            while last.next:
+                last = last.next
+            while gone.stack:
+                ws = gone.stack
+                gone.remove(ws)
+                self.focused.add(ws, last)
+                last = ws
+            await self.focused.relayout()
+
+        top = min(o.rect.y for o in self.outputs.values())
+        bottom = max(o.rect.y + o.rect.height for o in self.outputs.values())
+        for output in self.outputs.values():
+            output.above = top - (output.rect.y + output.rect.height)
+            output.below = bottom - output.rect.y
+            output.others = [o.rect for o in self.outputs.values() if o != output]
+
+    async def output_changed(self, i3: Connection, e) -> None:
+        await self.update_outputs()
+
+    def output_at(self, geo: Geo) -> Output:
+        x, y = geo[0] + geo[2]//2, geo[1] + geo[3]//2
+        for output in self.outputs.values():
+            r = output.rect
+            if r.x <= x < r.x + r.width and r.y <= y < r.y + r.height:
+                return output
+        return self.focused # type: ignore
+
+    async def control(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        # one json reply line per request line
+        try:
+            while line := await reader.readline():
+                words = line.decode().split()
+                if words == ["metrics"]:
+                    # outputs only have metrics if METRICS was set when they were created
+                    reply = {name: o.metrics.dump() for name, o in self.outputs.items() if o.metrics is not None}
+                    if not reply:
+                        reply = {"error": "metrics are disabled"}
+                elif words[:1] == ["action"] and len(words) == 2:
+                    if await self.action(words[1]):
+                        reply = {"success": True}
+                    else:
+                        reply = {"error": f"unknown action {words[1]!r}"}
+                elif words == ["subscribe"]:
+                    # a snapshot now, then a diff of it after each frame that changed anything
+                    self.publish()
+                    self.state = self.snapshot()
+                    self.streams.add(writer)
+                    reply = {"snapshot": self.state}
+                else:
+                    reply = {"error": f"unknown request {line.decode().strip()!r}"}
+                writer.write(json.dumps(reply).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.streams.discard(writer)
+            writer.close()
+
+    def snapshot(self) -> dict:
+        outputs = {}
+        windows = {}
+        for name, output in self.outputs.items():
+            current = 0
+            i = 0
+            ws = output.stack
+            while ws:
+                i += 1
+                if ws == output.current:
+                    current = i
+                j = 0
+                cont = ws.stack
+                while cont:
+                    j += 1
+                    k = 0
+                    win = cont.stack
+                    while win:
+                        k += 1
+                        windows[str(win.id)] = {
+                            "output": name,
+                            "workspace": i,
+                            "column": j,
+                            "row": k,
+                            "width": cont.width,
+                        }
+                        win = win.next
+                    cont = cont.next
+                ws = ws.next
+            outputs[name] = {"workspace": current, "workspaces": i, "focused": output == self.focused, "overview": output.overview}
+        return {"focused": self.focused_win, "outputs": outputs, "windows": windows}
+
+    def changed(self) -> None:
+        # every output's layouts within a frame of the last publish go out as one diff
+        if not self.streams or self.publishing:
+            return
+        self.publishing = True
+        loop = asyncio.get_running_loop()
+        rate = max((o.animator.rate for o in self.outputs.values()), default = 60)
+        loop.call_later(max(0, self.published + 1/rate - loop.time()), self.publish)
+
+    def publish(self) -> None:
+        self.publishing = False
+        self.published = asyncio.get_running_loop().time()
+        if not self.streams:
+            return
+        new = self.snapshot()
+        changes = diff(self.state, new)
+        self.state = new
+        if not changes:
+            return
+        data = json.dumps({"diff": changes}).encode() + b"\n"
+        for writer in list(self.streams):
+            # a subscriber that stopped reading is dropped rather than buffered forever
+            if writer.transport.get_write_buffer_size() > 1 << 20:
+                self.streams.discard(writer)
+                writer.close()
+                continue
+            writer.write(data)
+
+    async def add_win(self, e:WindowEvent) -> None:
+        await e.container.command("floating enable")  #type: ignore
+        shown = con_rect(e.container) # type: ignore
+        output = self.output_at(shown)
+        self.focused = output
+        ncont:Container = Container(output.screen.width//2)
+        new = Window(dict(
+            x = 0,
+            y = 0,
+            width = 100, 
+            height = 100
+        ), e.container.id) # type: ignore
+        new.shown = shown
+
+        ncont.add(new)
+        self.windows[new.id] = new
+        output.current.add(ncont, output.current.focus)
+        output.current.focus = ncont
+
+        await output.current.focus_cont(ncont)
+        output.move_all()
+
+    async def focus_win(self, i3:Connection, e:WindowEvent) -> None: 
+        self.focused_win = e.container.id # type: ignore
+        res = self.workspace_with_win(e.container.id) # type: ignore
+        if not res: 
+            await self.add_win(e)
+            return
+        workspace, cont, win = res
+        output: Output = workspace.parent # type: ignore
+        # the event carries the window's real geometry, a mismatch means the cache drifted
+        if win.id not in output.animator.anims and con_rect(e.container) != win.shown: # type: ignore
+            await self.reconcile()
+        workspace.focus = cont
+        output.current = workspace
+        self.focused = output
+        await workspace.focus_cont(cont)
+        output.move_all()
+
+    async def close_win(self, i3:Connection, e:WindowEvent) -> None: 
+        res = self.workspace_with_win(e.container.id) # type: ignore
+        if not res: 
+            return
+        workspace, cont, win = res
+        output: Output = workspace.parent # type: ignore
+        output.animator.cancel(win)
+        del self.windows[win.id]
+        if self.focused_win == win.id:
+            self.focused_win = None
+
+        if cont.size == 1:
+            fd = int(2*workspace.anchordir-1) * (-1 if cont != workspace.anchordir else 1)
+            new_focus = None
+            if fd < 0: 
+                if cont.prev: 
+                    new_focus = cont.prev
+                elif cont.next:
+                    new_focus = cont.next
+            else:
+                if cont.next: 
+                    new_focus = cont.next
+                elif cont.prev:
+                    new_focus = cont.prev
+
+            if workspace.anchor == cont: 
+                workspace.anchor = new_focus
+
+            cont.remove(win)
+            workspace.remove(cont)
+            workspace.focus = new_focus
+
+            if new_focus and new_focus.stack and output.current == workspace:
+                await new_focus.stack.focus(i3)
+        else: 
+            cont.remove(win)
+            if output.current == workspace:
+                if win.next:
+                    await win.next.focus(i3)
+                elif win.prev: 
+                    await win.prev.focus(i3)
+
+        # if workspace empty and not focused, delete it
+        if workspace.size == 0 and output.size > 1:
+            output.remove(workspace)
+        output.move_all()
+
+    async def mark_win(self, i3: Connection, e: WindowEvent) -> None: 
+        # bindings from older configs mark the window with '_<action>'
+        marks = [m[1:] for m in e.container.marks if m.startswith("_") and m[1:] in self.actions]
+
+        if len(marks) == 0:
+            return 
+
+        await e.container.command("unmark") # type: ignore
+
+        for mark in marks:
+            await self.action(mark, e.container.id) # type: ignore
+
+    async def binding(self, i3: Connection, e: BindingEvent) -> None:
+        # bindsym ... nop snirifx <action>, straight from the key press with no round trip
+        words = e.binding.command.split()
+        if words[:2] == ["nop", "snirifx"]:
+            for name in words[2:]:
+                await self.action(name)
+
+    async def action(self, name: str, id: int | None = None) -> bool:
+        # runs name on window id, the focused window by default
+        act = self.actions.get(name)
+        if not act:
+            return False
+
+        res = self.workspace_with_win(id or self.focused_win) # type: ignore
+        if res:
+            workspace, cont, win = res
+            output: Output = workspace.parent # type: ignore
+        elif name in ("up", "down", "overview") and self.focused:
+            # an empty workspace can still be left
+            output = self.focused
+            workspace, cont, win = output.current, None, None
+        else:
+            return True
+
+        if output.metrics:
+            output.metrics.action(name)
+        await act(output, workspace, cont, win)
+        return True
+
+    async def act_left(self, output: Output, workspace: Workspace, cont: Container, win: Window) -> None:
+        if cont.prev and cont.prev.stack:
+            await cont.prev.stack.focus(self.i3)
+
+    async def act_right(self, output: Output, workspace: Workspace, cont: Container, win: Window) -> None:
+        if cont.next and cont.next.stack: 
+            await cont.next.stack.focus(self.i3)
+
+    async def act_down(self, output: Output, workspace: Workspace, cont: Container, win: Window) -> None:
+        if win and win.prev and output.current == workspace:
+            await win.prev.focus(self.i3)
+        else:
+            await output.workspace_down()
 
-    async def workspace_with_win(self, id: int) -> tuple[Workspace, Container, Window] | None:
+    async def act_up(self, output: Output, workspace: Workspace, cont: Container, win: Window) -> None:
+        if win and win.next and output.current == workspace:
+            await win.next.focus(self.i3)
+        else:
+            await output.workspace_up()
+
+    async def act_decwidth(self, output: Output, workspace: Workspace, cont: Container, win: Window) -> None:
+        cont.width -= DWIDTH
+        cont.width = max(cont.width, 150)
+        await workspace.focus_cont(cont)
+        output.move_all()
+
+    async def act_incwidth(self, output: Output, workspace: Workspace, cont: Container, win: Window) -> None:
+        cont.width += DWIDTH
+        cont.width = min(cont.width, output.screen.width)
+        await workspace.focus_cont(cont)
+        output.move_all()
+
+    async def act_fullwidth(self, output: Output, workspace: Workspace, cont: Container, win: Window) -> None:
+        cont.width = output.screen.width
+        await workspace.focus_cont(cont)
+        output.move_all()
+
+    async def act_moveleft(self, output: Output, workspace: Workspace, cont: Container, win: Window) -> None:
+        cont.remove(win)
+        if cont.size == 0: 
+            if cont.prev: 
+                workspace.remove(cont)
+                cont.prev.add(win)
+                if workspace.anchor == cont: 
+                    workspace.anchor = cont.prev
+                await workspace.focus_cont(cont.prev)
+                output.move_all()
+        else:
+            ncont: Container = Container(output.screen.width//2) # type: ignore
+            ncont.add(win)
+            workspace.add(ncont, cont.prev)
+            await workspace.focus_cont(ncont)
+            output.move_all()
+
+    async def act_moveright(self, output: Output, workspace: Workspace, cont: Container, win: Window) -> None:
+        cont.remove(win)
+        if cont.size == 0: 
+            if cont.next: 
+                workspace.remove(cont)
+                cont.next.add(win)
+                if workspace.anchor == cont: 
+                    workspace.anchor = cont.prev
+                await workspace.focus_cont(cont.next)
+                output.move_all()
+        else:
+            ncont: Container = Container(output.screen.width//2)
+            ncont.add(win)
+            workspace.add(ncont, cont)
+            await workspace.focus_cont(ncont)
+            output.move_all()
+
+    async def act_swapleft(self, output: Output, workspace: Workspace, cont: Container, win: Window) -> None:
+        if cont.prev:
+            if workspace.anchor == cont: 
+                workspace.anchor = cont.prev
+            workspace.swap(cont.prev, cont)
+            await workspace.focus_cont(cont)
+            output.move_all()
 
-        wcur = self.stack
-        while wcur: 
-            res = await wcur.cont_with_win(id)
-            if res: 
-                return (wcur, res[0], res[1])
-            wcur = wcur.next
+    async def act_swapright(self, output: Output, workspace: Workspace, cont: Container, win: Window) -> None:
+        if cont.next:
+            if workspace.anchor == cont: 
+                workspace.anchor = cont.next
+            workspace.swap(cont, cont.next)
+            await workspace.focus_cont(cont)
+            output.move_all()
 
-    async def move_all(self): 
-        global animid
+    async def act_moveup(self, output: Output, workspace: Workspace, cont: Container, win: Window) -> None:
+        if win.next:
+            cont.swap(win, win.next)
+            await workspace.focus_cont(cont)
+            output.move_all()
+        # This does not work yet, and I don't know why. If you do find out, please let me know
+        # else: 
+        #     await output.workspace_move_up()
+
+    async def act_movedown(self, output: Output, workspace: Workspace, cont: Container, win: Window) -> None:
+        if win.prev:
+            cont.swap(win.prev, win)
+            await workspace.focus_cont(cont)
+            output.move_all()
+        # else: 
+        #     await output.workspace_move_down()
+
+    async def act_center(self, output: Output, workspace: Workspace, cont: Container, win: Window) -> None:
+        await workspace.anchor_set(cont, 0.5)
+        output.move_all()
+
+    async def act_overview(self, output: Output, workspace: Workspace, cont: Container, win: Window) -> None:
+        # the usual keys move focus around it, keys of its own come from OVERVIEW_MODE so none of
+        # the user's bindings are touched
+        output.toggle_overview()
+        if OVERVIEW_MODE not in await self.i3.get_binding_modes():
+            return
+        if output.overview:
+            await self.i3.command(f'mode "{OVERVIEW_MODE}"')
+        elif not any(o.overview for o in self.outputs.values()):
+            await self.i3.command("mode default")
+
+    def workspace_with_win(self, id: int) -> tuple[Workspace, Container, Window] | None:
+        win = self.windows.get(id)
+        if not win or not win.parent or not win.parent.parent:
+            return None
+        return (win.parent.parent, win.parent, win)
+
+    async def reconcile(self) -> None:
         tree = await self.i3.get_tree()
+        for win in self.windows.values():
+            res = self.workspace_with_win(win.id)
+            # in flight windows are ahead of the tree
+            if not res or win.id in res[0].parent.animator.anims: # type: ignore
+                continue
+            con = tree.find_by_id(win.id)
+            if not con:
+                continue
+            win.shown = con_rect(con)
+            if win.shown != win.sent:
+                # moved from under us, the next layout sends it back
+                win.sent = None
+                res[0].parked = None
+                res[0].parent.move_all() # type: ignore
+
+    async def watch_drift(self) -> None:
+        while True:
+            await asyncio.sleep(RECONCILE)
+            await self.reconcile()
+
+    def layout(self) -> dict:
+        # column order, widths, stacking and anchors of every workspace, by output name
+        out = {}
+        for name, output in self.outputs.items():
+            workspaces = []
+            ws = output.stack
+            while ws:
+                cols = ws.columns()
+                workspaces.append({
+                    "current": ws == output.current,
+                    "anchor": ws.anchor.col if ws.anchor else None,
+                    "anchordir": ws.anchordir,
+                    "focus": ws.focus.col if ws.focus else None,
+                    "columns": [{"width": c.width, "windows": [w.id for w in c]} for c in cols],
+                })
+                ws = ws.next
+            out[name] = workspaces
+        return out
+
+    async def persist(self) -> None:
+        saved = None
+        while True:
+            await asyncio.sleep(SAVE)
+            data = json.dumps(self.layout())
+            if data == saved:
+                continue
+            with open(SNAPSHOT + ".tmp", "w") as f:
+                f.write(data)
+            os.replace(SNAPSHOT + ".tmp", SNAPSHOT)
+            saved = data
+
+    async def restore(self) -> None:
+        # rebuilds the saved layout against a single get_tree, windows that are gone are dropped
+        # and windows it doesn't know are appended, then everything is laid out in one frame
+        try:
+            with open(SNAPSHOT) as f:
+                saved: dict = json.load(f)
+        except (OSError, ValueError):
+            saved = {}
+        if self.recorder:
+            self.recorder.write("snapshot", "", saved)
+        # the empty workspace each output starts with, replaced by the saved ones
+        initial = {name: o.stack for name, o in self.outputs.items()}
 
-        animid += 1
-        passed: bool = False
-        async with asyncio.TaskGroup() as tg:
-            wscur = self.stack
-            while wscur: 
-                if self.current == wscur:
-                    passed = True
-                ccur = wscur.stack
-                while ccur:
-                    wcur = ccur.stack
-                    while wcur:
-                        if self.current != wscur: 
-                            tg.create_task(wcur.move_win(self.i3, tree, TRUE_SCREEN_HEIGHT if passed else -TRUE_SCREEN_HEIGHT))
-                        else:
-                            tg.create_task(wcur.move_win(self.i3, tree))
-                        wcur = wcur.next
-                    ccur = ccur.next
-                wscur = wscur.next
+        tree = await self.i3.get_tree()
+        cons = {
+            c.id: c for c in tree 
+            if c.type in ("con", "floating_con") and not c.nodes and c.parent.type != "dockarea"
+        }
+        focused = tree.find_focused()
+        if focused and focused.id in cons:
+            self.focused_win = focused.id
+
+        def adopt(id: int, cont: Container, last: Window | None = None) -> Window:
+            win = Window(dict(x = 0, y = 0, width = 100, height = 100), id)
+            win.shown = con_rect(cons.pop(id))
+            # already on screen there, it only animates if the layout wants it elsewhere
+            win.sent = win.shown
+            cont.add(win, last)
+            self.windows[id] = win
+            return win
+
+        for name, workspaces in saved.items():
+            output = self.outputs.get(name, self.focused)
+            if not output:
+                continue
+            last = output.stack
+            while last.next:
+                last = last.next
+            for w in workspaces:
+                ws = Workspace()
+                cols: list[Container | None] = []
+                prev = None
+                for c in w["columns"]:
+                    cont = Container(c["width"])
+                    win = None
+                    for id in c["windows"]:
+                        if id in cons:
+                            win = adopt(id, cont, win)
+                    if cont.size:
+                        ws.add(cont, prev)
+                        prev = cont
+                    cols.append(cont if cont.size else None)
+                if not ws.size and not w["current"]:
+                    continue
+                ws.anchordir = w["anchordir"]
+                ws.anchor = cols[w["anchor"]] if w["anchor"] is not None else None
+                ws.focus = cols[w["focus"]] if w["focus"] is not None else None
+                ws.anchor = ws.anchor or ws.stack
+                ws.focus = ws.focus or ws.anchor
+                output.add(ws, last)
+                last = ws
+                if w["current"] and output.current == initial.get(output.name):
+                    output.current = ws
+
+        # windows opened while it wasn't running, as new columns where they are
+        new = [id for id in cons if cons[id].workspace() and cons[id].workspace().name != "__i3_scratch"]
+        for id in new:
+            output = self.output_at(con_rect(cons[id]))
+            ws = output.current
+            cont = Container(output.screen.width//2)
+            ws.add(cont, list(ws)[-1] if ws.stack else None)
+            adopt(id, cont)
+            ws.anchor = ws.anchor or cont
+            if id == self.focused_win or not ws.focus:
+                ws.focus = cont
+        if new:
+            await self.i3.command("; ".join(f"[con_id={id}] floating enable" for id in new))
+
+        for name, output in self.outputs.items():
+            if output.current != initial[name] and initial[name].size == 0:
+                output.remove(initial[name])
+            await output.relayout()
 
 if __name__ == "__main__": 
-    animid: int = 0
     niri = Niri()
     asyncio.run(niri.setup())
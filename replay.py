@@ -0,0 +1,251 @@
+#! /usr/bin/env python3
+# records the sway events and commands of a niri.py session (set niri.RECORD), and replays them
+# through Niri against a fake connection, so a slow session can be profiled offline
+import argparse
+import asyncio
+import cProfile
+import gzip
+import json
+import os
+import pstats
+import sys
+import tempfile
+import time
+from collections import deque
+
+from i3ipc import Event, BindingEvent, OutputEvent, WindowEvent
+from i3ipc.aio import Connection, Con
+from i3ipc.replies import OutputReply
+from i3ipc._private import MessageType
+
+# settings that are about where this machine keeps things, not how the session behaved
+LOCAL = ("CONTROL", "SNAPSHOT", "RECORD")
+
+def open_log(path: str, mode: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t")
+    return open(path, mode)
+
+class Recorder:
+    # one json line per record: [seconds since start, kind, name, data]
+    def __init__(self, path: str) -> None:
+        self.f = open_log(path, "w")
+        self.start = time.perf_counter()
+
+    def write(self, kind: str, name: str, data = None) -> None:
+        self.f.write(json.dumps([round(time.perf_counter() - self.start, 6), kind, name, data], separators = (",", ":")) + "\n")
+
+    def wrap(self, event: Event, handler):
+        async def recorded(i3, e) -> None:
+            self.write("event", event.value, e.ipc_data)
+            # events are rare next to frames, flushing here keeps a killed session's log usable
+            self.f.flush()
+            await handler(i3, e)
+        return recorded
+
+class RecordingConnection(Connection):
+    # also logs commands sent on it and the replies replay has to give back
+    def __init__(self, recorder: Recorder) -> None:
+        super().__init__()
+        self.recorder = recorder
+
+    async def _message(self, message_type: MessageType, payload: str = "") -> bytes:
+        data = await super()._message(message_type, payload)
+        if message_type == MessageType.COMMAND:
+            self.recorder.write("command", "main", payload)
+        elif message_type in (MessageType.GET_TREE, MessageType.GET_OUTPUTS, MessageType.GET_BINDING_MODES):
+            self.recorder.write("reply", message_type.name, json.loads(data))
+        return data
+
+class FakeConnection:
+    # answers the way sway did in the recording and counts what it's sent
+    def __init__(self, replies: dict[str, deque]) -> None:
+        self.replies = replies
+        self.socket_path = ""
+        self.commands = 0
+        # every output's frame pool is this connection too
+        self.pipes = [self]
+
+    def reply(self, name: str):
+        # once the recorded replies run out the last one is given again
+        q = self.replies[name]
+        return q.popleft() if len(q) > 1 else q[0]
+
+    async def command(self, payload: str, key: int = 0, metrics = None) -> list:
+        self.commands += 1
+        return []
+
+    def close(self) -> None:
+        pass
+
+    async def get_tree(self) -> Con:
+        return Con(self.reply("GET_TREE"), None, self)
+
+    async def get_outputs(self) -> list[OutputReply]:
+        return OutputReply._parse_list(self.reply("GET_OUTPUTS"))
+
+    async def get_binding_modes(self) -> list[str]:
+        # older logs didn't record them
+        return self.reply("GET_BINDING_MODES") if self.replies["GET_BINDING_MODES"] else ["default"]
+
+def make_event(name: str, data: dict, conn: FakeConnection):
+    kind = name.split("::")[0]
+    if kind == "window":
+        return WindowEvent(data, conn, _Con = Con)
+    if kind == "binding":
+        return BindingEvent(data)
+    return OutputEvent(data)
+
+class Stats:
+    def __init__(self) -> None:
+        self.count: dict[str, int] = {}
+        self.total: dict[str, float] = {}
+        self.max: dict[str, float] = {}
+
+    def add(self, name: str, seconds: float) -> None:
+        self.count[name] = self.count.get(name, 0) + 1
+        self.total[name] = self.total.get(name, 0) + seconds
+        self.max[name] = max(self.max.get(name, 0), seconds)
+
+    def dump(self) -> None:
+        print(f"{'':<16}{'count':>8}{'total ms':>12}{'mean ms':>10}{'max ms':>10}")
+        for name in sorted(self.total, key = lambda n: -self.total[n]):
+            n, t = self.count[name], self.total[name]
+            print(f"{name:<16}{n:>8}{1000*t:>12.2f}{1000*t/n:>10.3f}{1000*self.max[name]:>10.3f}")
+
+class Replay:
+    def __init__(self, path: str, realtime: bool) -> None:
+        import niri
+        self.niri_module = niri
+        self.realtime = realtime
+        self.events: list[tuple[float, str, dict]] = []
+        self.replies: dict[str, deque] = {"GET_TREE": deque(), "GET_OUTPUTS": deque(), "GET_BINDING_MODES": deque()}
+        self.snapshot: dict = {}
+        # the settings in effect at the start, later ones are reloads replayed as events
+        self.settings: dict | None = None
+        self.recorded = 0
+        for t, kind, name, data in self.read(path):
+            if kind == "event":
+                self.events.append((t, name, data))
+            elif kind == "settings":
+                if self.settings is None:
+                    self.settings = data
+                else:
+                    self.events.append((t, "settings", data))
+            elif kind == "reply":
+                self.replies[name].append(data)
+            elif kind == "snapshot":
+                self.snapshot = data
+            elif kind == "command":
+                self.recorded += 1
+        self.now: float = 0
+        self.stats = Stats()
+
+    def read(self, path: str):
+        # a killed session ends wherever it was last flushed, possibly mid line
+        with open_log(path, "r") as f:
+            try:
+                for line in f:
+                    yield json.loads(line)
+            except (EOFError, ValueError):
+                pass
+
+    async def wait(self, t: float) -> None:
+        self.now = t
+        if self.realtime:
+            await asyncio.sleep(max(0, self.start + t - time.perf_counter()))
+
+    async def frames(self, until: float) -> None:
+        # what each output's animator loop would have sent before until, at its frame rate
+        for output in list(self.niri.outputs.values()):
+            a = output.animator
+            while (len(a.anims) or a.pending) and a.next <= until:
+                await self.wait(a.next)
+                start = time.perf_counter()
+                if a.pending:
+                    a.pending = False
+                    a.layout()
+                a.last = a.next
+                await a.tick(a.next)
+                self.stats.add("frame", time.perf_counter() - start)
+                a.next += 1 / a.rate
+
+    def configure(self, settings: dict) -> None:
+        for name, value in settings.items():
+            if name not in LOCAL:
+                setattr(self.niri_module, name, value)
+
+    async def run(self) -> None:
+        niri = self.niri_module
+        niri.clock = lambda: self.now
+        # logs from before settings were recorded replay with niri.py's defaults
+        self.configure(self.settings or {})
+        fd, niri.SNAPSHOT = tempfile.mkstemp(suffix = ".json")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.snapshot, f)
+
+        class ReplayNiri(niri.Niri):
+            def spawn(self, coro) -> asyncio.Task:
+                # frames are stepped by Replay.frames instead of the animator loops
+                coro.close()
+                return asyncio.ensure_future(asyncio.sleep(0))
+
+            async def connect_pool(self):
+                return fake
+
+        fake = FakeConnection(self.replies)
+        self.niri = ReplayNiri()
+        self.niri.i3 = fake
+        handlers = self.niri.handlers()
+
+        self.start = time.perf_counter()
+        await self.niri.update_outputs()
+        await self.niri.restore()
+        os.unlink(niri.SNAPSHOT)
+
+        for t, name, data in self.events:
+            await self.frames(t)
+            await self.wait(t)
+            # an animator woken by this event starts its frames now
+            for output in self.niri.outputs.values():
+                if not len(output.animator.anims) and not output.animator.pending:
+                    output.animator.next = t
+            start = time.perf_counter()
+            if name == "settings":
+                old = niri.BINDINGS
+                self.configure(data)
+                await self.niri.apply(old)
+            else:
+                await handlers[Event(name)](fake, make_event(name, data, fake))
+            self.stats.add(name, time.perf_counter() - start)
+        await self.frames(float("inf"))
+
+        print(f"{len(self.events)} events in {time.perf_counter() - self.start:.3f}s, {self.now:.3f}s recorded")
+        print(f"{fake.commands} commands sent, {self.recorded} recorded")
+        self.stats.dump()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description = "replay a niri.py session recorded with RECORD")
+    parser.add_argument("log")
+    parser.add_argument("--realtime", action = "store_true", help = "keep the recorded timing instead of running as fast as possible")
+    parser.add_argument("--profile", help = "write cProfile stats to this file")
+    parser.add_argument("--sort", default = "cumulative", help = "pstats sort key for the printed profile")
+    parser.add_argument("--top", type = int, default = 25, help = "functions of the profile to print")
+    parser.add_argument("--repeat", type = int, default = 1, help = "replay the log this many times")
+    args = parser.parse_args()
+
+    profiler = cProfile.Profile() if args.profile else None
+    for _ in range(args.repeat):
+        replay = Replay(args.log, args.realtime)
+        if profiler:
+            profiler.enable()
+        asyncio.run(replay.run())
+        if profiler:
+            profiler.disable()
+
+    if profiler:
+        profiler.dump_stats(args.profile)
+        pstats.Stats(profiler, stream = sys.stdout).sort_stats(args.sort).print_stats(args.top)
+
+if __name__ == "__main__":
+    main()
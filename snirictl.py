@@ -0,0 +1,40 @@
+#! /usr/bin/env python3
+# sends a request to a running niri.py over its control socket and prints the reply
+# snirictl.py action left | snirictl.py metrics | snirictl.py subscribe
+import argparse
+import os
+import socket
+
+CONTROL = os.path.join(os.environ.get("XDG_RUNTIME_DIR", "/tmp"), "snirifx.sock")
+CONFIG = os.path.join(os.environ.get("XDG_CONFIG_HOME", os.path.expanduser("~/.config")), "snirifx", "config.toml")
+
+def control() -> str:
+    # wherever niri.py's config moved the socket to, the default without one
+    try:
+        import tomllib
+        with open(CONFIG, "rb") as f:
+            return tomllib.load(f)["control"]
+    except (ImportError, OSError, KeyError, ValueError):
+        return CONTROL
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description = "talk to a running niri.py", usage = "%(prog)s [--socket PATH] action <name> | metrics | subscribe")
+    parser.add_argument("--socket", help = f"control socket, by default control from {CONFIG} or {CONTROL}")
+    parser.add_argument("request", nargs = "+")
+    args = parser.parse_args()
+
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    s.connect(args.socket or control())
+    s.sendall(" ".join(args.request).encode() + b"\n")
+    f = s.makefile()
+    # a subscription keeps streaming diffs until niri.py exits
+    for line in f:
+        print(line, end = "", flush = True)
+        if args.request[0] != "subscribe":
+            break
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        pass